@@ -0,0 +1,145 @@
+"""Measure emote layout time per message, with and without the layout cache.
+
+Usage: python benchmarks/bench_emotes.py [corpus.txt] [--repeat N] [--cache-size N]
+
+The corpus is a file of raw IRC lines, one per line, as received from
+irc.chat.twitch.tv. Only PRIVMSGs carrying an emotes tag are laid out. Without
+a corpus, a synthetic one is generated in which most emote messages are
+repeated copypastas, as in a busy channel.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import EMOTE_LAYOUT_CACHE_SIZE, LRUCache, layout_emotes, parse_twitch_line
+
+
+def legacy_layout(message, emote_info):
+    """The original per-message layout from _render_message, kept as the baseline"""
+    emotes = []
+    for emote in emote_info.split('/'):
+        emote_id, sep, positions = emote.partition(':')
+        if sep and positions:
+            emotes.append((emote_id, positions.split(',')))
+
+    message_parts = []
+    last_pos = 0
+    emote_positions = []
+    for emote_id, positions in emotes:
+        for pos in positions:
+            start, end = map(int, pos.split('-'))
+            emote_positions.append((start, end, emote_id))
+
+    emote_positions.sort()
+
+    for start, end, emote_id in emote_positions:
+        if start > last_pos:
+            message_parts.append(message[last_pos:start])
+        message_parts.append((message[start:end + 1], f"emote_{emote_id}"))
+        last_pos = end + 1
+
+    if last_pos < len(message):
+        message_parts.append(message[last_pos:])
+    return message_parts
+
+
+def emote_tag(message, names):
+    """Build an emotes tag value for every whole-word occurrence of names in message"""
+    spans = {}
+    pos = 0
+    for word in message.split(' '):
+        if word in names:
+            spans.setdefault(names[word], []).append(f"{pos}-{pos + len(word) - 1}")
+        pos += len(word) + 1
+    return '/'.join(f"{emote_id}:{','.join(ranges)}" for emote_id, ranges in spans.items())
+
+
+def synthetic_corpus(count=50000, seed=1234):
+    rng = random.Random(seed)
+    names = {"Kappa": "25", "PogChamp": "305954156", "LUL": "425618", "BibleThump": "86", "4Head": "354"}
+    words = ["hello", "chat", "what", "is", "this", "gg", "no", "way", "😂", "clip", "it"] + list(names)
+    copypastas = [" ".join(rng.choice(words) for _ in range(rng.randrange(8, 30))) for _ in range(40)]
+    lines = []
+    for _ in range(count):
+        user = f"user{rng.randrange(5000)}"
+        if rng.random() < 0.7:
+            text = rng.choice(copypastas)
+        else:
+            text = " ".join(rng.choice(words) for _ in range(rng.randrange(1, 15)))
+        lines.append(f"@badges=;color=;display-name={user};emotes={emote_tag(text, names)};room-id=12345 "
+                     f":{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #channel :{text}")
+    return lines
+
+
+def emote_messages(lines):
+    messages = []
+    for line in lines:
+        msg = parse_twitch_line(line)
+        if msg:
+            emote_info = msg.tag('emotes')
+            if emote_info:
+                messages.append((msg.message, emote_info))
+    return messages
+
+
+def run(name, func, messages, repeat, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for message, emote_info in messages:
+            func(message, emote_info)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_message = best * 1e6 / len(messages)
+    print(f"{name:<12} {per_message:>8.2f} us/message")
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", help="file of raw IRC lines")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache-size", type=int, default=EMOTE_LAYOUT_CACHE_SIZE)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8", errors="replace") as f:
+            lines = [line.rstrip("\r\n") for line in f if line.strip()]
+    else:
+        lines = synthetic_corpus()
+
+    messages = emote_messages(lines)
+    if not messages:
+        print("no messages with emotes in corpus")
+        return
+
+    cache = LRUCache(args.cache_size)
+
+    def reset_cache():
+        cache.items.clear()
+        cache.hits = cache.misses = 0
+
+    def cached_layout(message, emote_info):
+        key = (emote_info, message)
+        layout = cache.get(key)
+        if layout is None:
+            layout = layout_emotes(message, emote_info)
+            cache[key] = layout
+        return layout
+
+    print(f"{len(messages):,} messages with emotes, best of {args.repeat}")
+    legacy = run("legacy", legacy_layout, messages, args.repeat)
+    uncached = run("uncached", layout_emotes, messages, args.repeat)
+    cached = run("cached", cached_layout, messages, args.repeat, reset_cache)
+    hit_rate = cache.hits / max(1, cache.hits + cache.misses)
+    print(f"speedup      {legacy / cached:.2f}x cached ({hit_rate:.0%} hits), {legacy / uncached:.2f}x uncached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Compare Twitch IRC parsing throughput against the original regex parser.
+
+Usage: python benchmarks/bench_parse.py [corpus.txt] [--repeat N]
+
+The corpus is a file of raw IRC lines, one per line, as received from
+irc.chat.twitch.tv. Without one, a synthetic corpus with a realistic mix of
+tagged PRIVMSGs and JOIN/PART/USERSTATE noise is generated.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import parse_twitch_line
+
+
+def legacy_parse_twitch_message(irc_message):
+    """The original MultiPlatformChat.parse_twitch_message, kept as the baseline"""
+    tags = {}
+    username = None
+    message = None
+    color = None
+    badges = []
+    is_donation = False
+    is_highlight = False
+    bits = 0
+    emotes = []
+
+    if irc_message.startswith('@'):
+        tag_part, irc_message = irc_message.split(' ', 1)
+        for tag in tag_part[1:].split(';'):
+            if '=' in tag:
+                key, value = tag.split('=', 1)
+                tags[key] = value
+
+    privmsg_match = re.match(r':([^!]+)![^ ]+ PRIVMSG #[^ ]+ :(.*)', irc_message)
+    if privmsg_match:
+        username = privmsg_match.group(1)
+        message = privmsg_match.group(2)
+
+        is_donation = any(word in message.lower() for word in ['donated', 'donation', 'cheered'])
+        is_highlight = 'msg-id=highlighted-message' in tags.get('flags', '')
+
+        if 'bits' in tags:
+            try:
+                bits = int(tags['bits'])
+                is_donation = True
+            except:
+                pass
+
+        color = tags.get('color')
+        if color:
+            color = f'#{color}' if not color.startswith('#') else color
+
+        badge_info = tags.get('badges', '')
+        if badge_info:
+            for badge in badge_info.split(','):
+                badge_parts = badge.split('/', 1)
+                if len(badge_parts) == 2:
+                    badge_name, badge_version = badge_parts
+                    badges.append((badge_name, badge_version))
+
+        emote_info = tags.get('emotes', '')
+        if emote_info:
+            for emote in emote_info.split('/'):
+                emote_parts = emote.split(':')
+                if len(emote_parts) >= 2:
+                    emotes.append((emote_parts[0], emote_parts[1:]))
+
+    return username, message, color, badges, is_donation, is_highlight, bits, emotes
+
+
+def synthetic_corpus(count=50000, seed=1234):
+    rng = random.Random(seed)
+    words = ["PogChamp", "KEKW", "hello", "chat", "what", "is", "this", "LUL", "gg", "no", "way", "Kappa"]
+    badge_sets = ["", "subscriber/12", "moderator/1,subscriber/24", "vip/1", "broadcaster/1,subscriber/0", "premium/1"]
+    lines = []
+    for i in range(count):
+        user = f"user{rng.randrange(5000)}"
+        roll = rng.random()
+        if roll < 0.15:
+            lines.append(f":{user}!{user}@{user}.tmi.twitch.tv JOIN #channel")
+            continue
+        if roll < 0.2:
+            lines.append(f":{user}!{user}@{user}.tmi.twitch.tv PART #channel")
+            continue
+        if roll < 0.22:
+            lines.append("@badge-info=;badges=;color=;display-name=justinfan;emote-sets=0;mod=0;subscriber=0;user-type= "
+                         ":tmi.twitch.tv USERSTATE #channel")
+            continue
+        text = " ".join(rng.choice(words) for _ in range(rng.randrange(1, 15)))
+        emotes = ""
+        if text.startswith("Kappa"):
+            emotes = "25:0-4"
+        tags = (f"badge-info=subscriber/12;badges={rng.choice(badge_sets)};client-nonce={rng.getrandbits(128):032x};"
+                f"color=#{rng.getrandbits(24):06X};display-name={user};emotes={emotes};first-msg=0;flags=;"
+                f"id={rng.getrandbits(128):032x};mod=0;returning-chatter=0;room-id=12345;subscriber=1;"
+                f"tmi-sent-ts=1700000000000;turbo=0;user-id={rng.randrange(10**8)};user-type=")
+        if rng.random() < 0.01:
+            tags += ";bits=100"
+        lines.append(f"@{tags} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #channel :{text}")
+    return lines
+
+
+def run(name, func, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(lines) / best
+    print(f"{name:<12} {rate:>12,.0f} lines/s  ({best * 1e6 / len(lines):.2f} us/line)")
+    return rate
+
+
+def consume_new(line):
+    # Touch every field the renderer needs so lazy tag parsing is included in the cost
+    msg = parse_twitch_line(line)
+    if msg:
+        return (msg.username, msg.message, msg.color, msg.badges,
+                msg.is_donation, msg.is_highlight, msg.bits, msg.emotes)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", help="file of raw IRC lines")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8", errors="replace") as f:
+            lines = [line.rstrip("\r\n") for line in f if line.strip()]
+    else:
+        lines = synthetic_corpus()
+
+    print(f"{len(lines):,} lines, best of {args.repeat}")
+    legacy = run("legacy", legacy_parse_twitch_message, lines, args.repeat)
+    framing = run("frame only", parse_twitch_line, lines, args.repeat)
+    new = run("single-pass", consume_new, lines, args.repeat)
+    print(f"speedup      {new / legacy:.2f}x all fields, {framing / legacy:.2f}x without tag access")
+
+
+if __name__ == "__main__":
+    main()
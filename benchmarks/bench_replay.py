@@ -0,0 +1,88 @@
+"""Replay a chat recording through ChatEngine and measure end-to-end throughput.
+
+Usage: python benchmarks/bench_replay.py [recording.log.gz] [--speed X]
+
+The recording is a file written by ChatEngine.start_recording (or the CLI's
+--record option). Without one, a synthetic recording is written from the
+bench_parse corpus to a temporary file. Each run replays the recording through
+the same parsing and publishing path as live chat and reports messages per
+second and the latency from a record being queued to a subscriber receiving
+it. Emote layout happens while publishing, so it is included; drawing to the
+Tk canvas is not, as it needs a display.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import ChatEngine, ChatRecorder
+from bench_parse import synthetic_corpus
+
+
+def write_synthetic_recording(path, rate=2000.0):
+    """Record the synthetic corpus as if it had arrived at rate lines per second"""
+    recorder = ChatRecorder(path)
+    start = time.time()
+    for i, line in enumerate(synthetic_corpus()):
+        recorder.record('twitch', line, start + i / rate)
+    recorder.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(path, speed):
+    chat = ChatEngine()
+    latencies = []
+    done = threading.Event()
+
+    def on_records(records):
+        now = time.monotonic()
+        for record in records:
+            if record.kind == 'chat':
+                latencies.append(now - record.queued_at)
+
+    def on_event(event, platform, detail):
+        if event == 'ended' and platform == 'replay':
+            done.set()
+
+    chat.subscribe(on_records)
+    chat.watch(on_event)
+    start = time.perf_counter()
+    chat.start_replay(path, speed)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    chat.close()
+
+    latencies.sort()
+    count = len(latencies)
+    print(f"{count:,} messages in {elapsed:.2f}s  ({count / elapsed:,.0f} messages/s)")
+    print(f"latency      p50 {percentile(latencies, 0.5) * 1e3:.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.2f} ms  max {percentile(latencies, 1.0) * 1e3:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", nargs="?", help="recording written by ChatEngine.start_recording")
+    parser.add_argument("--speed", type=float, default=0, help="replay speed multiplier, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    if args.recording:
+        run(args.recording, args.speed)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.log.gz")
+        write_synthetic_recording(path)
+        run(path, args.speed)
+
+
+if __name__ == "__main__":
+    main()
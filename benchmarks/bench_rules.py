@@ -0,0 +1,75 @@
+"""Measure filter rule evaluation time per message as the number of keyword rules grows.
+
+Usage: python benchmarks/bench_rules.py [corpus.txt] [--rules N ...]
+
+The corpus is a file of raw IRC lines, one per line, as received from
+irc.chat.twitch.tv. Without one, the synthetic bench_parse corpus is used.
+Each keyword rule gets its own random keyword, so almost no rule matches and
+the cost shown is what every message pays just to be checked.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import ChatRecord, RuleSet, parse_twitch_line
+from bench_parse import synthetic_corpus
+
+
+def naive_rules(config):
+    """One regex per rule, tried in turn: the baseline a compiled RuleSet replaces"""
+    patterns = [re.compile(r"(?<!\w)(?:%s)(?!\w)" % "|".join(map(re.escape, rule["keywords"])), re.IGNORECASE)
+                for rule in config]
+
+    def apply(record):
+        return any(pattern.search(record.message) for pattern in patterns)
+    return apply
+
+
+def run(name, apply, records, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for record in records:
+            apply(record)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_message = best * 1e6 / len(records)
+    print(f"{name:<20} {per_message:>8.2f} us/message")
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", help="file of raw IRC lines")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8", errors="replace") as f:
+            lines = [line.rstrip("\r\n") for line in f if line.strip()]
+    else:
+        lines = synthetic_corpus()
+
+    records = []
+    for line in lines:
+        msg = parse_twitch_line(line)
+        if msg:
+            records.append(ChatRecord('chat', '', 'twitch', msg.username, msg.message, roles=msg.roles))
+
+    rng = random.Random(1234)
+    print(f"{len(records):,} messages, best of {args.repeat}")
+    for count in args.rules:
+        config = [{"action": "highlight", "keywords": [f"word{i}x{rng.randrange(10**6)}"]} for i in range(count)]
+        naive = run(f"naive {count}", naive_rules(config), records, args.repeat)
+        compiled = run(f"compiled {count}", RuleSet(config).apply, records, args.repeat)
+        print(f"speedup              {naive / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,7 @@ for %%p in (%packages%) do (
 echo All required packages are installed.
 echo Building executable with PyInstaller...
 
-pyinstaller --onefile --windowed --name "Twitch And Youtube Chat" --icon=icon.ico main.py
+pyinstaller --onefile --windowed --hidden-import pytchat --name "Twitch And Youtube Chat" --icon=icon.ico main.py
 
 if %errorlevel% neq 0 (
     echo PyInstaller build failed
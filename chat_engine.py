@@ -0,0 +1,2113 @@
+"""Chat connections, parsing and normalization without tkinter.
+
+ChatEngine owns the Twitch and YouTube sessions and publishes ChatRecords to its
+subscribers; the Tk window in main.py is one such subscriber. Run this module
+directly to print or forward chat on a headless machine:
+
+    python chat_engine.py --twitch channel1,channel2 --youtube @handle --json
+"""
+import argparse
+import gzip
+import itertools
+import ssl
+import socket
+import sys
+import threading
+import asyncio
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import queue
+import sqlite3
+from urllib.parse import urlparse, parse_qs
+import codecs
+import importlib
+import random
+import re
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+TWITCH_SERVER = 'irc.chat.twitch.tv'
+TWITCH_PORT = 6697
+TWITCH_RECV_BUFFER = 16384
+TWITCH_JOIN_LIMIT = 20
+TWITCH_JOIN_WINDOW = 10.5
+TWITCH_AUTH_FAILURES = ('Login authentication failed', 'Improperly formatted auth')
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+RECONNECT_STABLE_TIME = 30.0
+YOUTUBE_MIN_POLL_INTERVAL = 1.0
+YOUTUBE_MAX_POLL_INTERVAL = 30.0
+YOUTUBE_LIVE_CACHE_TTL = 300.0
+YOUTUBE_LIVE_MISS_TTL = 60.0
+YOUTUBE_QUOTA_COSTS = {'search': 100, 'channels': 1, 'playlistItems': 1, 'videos': 1}
+# YouTube resets the daily quota at midnight Pacific; standard time is close enough for a counter
+YOUTUBE_QUOTA_TZ = timezone(timedelta(hours=-8))
+YOUTUBE_PAID_TYPES = {'superChat': 'Super Chat', 'superSticker': 'Super Sticker', 'donation': 'Donation'}
+YOUTUBE_API_BASE = "https://www.googleapis.com/youtube/v3"
+TWITCH_API_BASE = "https://api.twitch.tv/helix"
+GLOBAL_BADGES_URL = "https://badges.twitch.tv/v1/badges/global/display"
+CHANNEL_BADGES_URL = "https://badges.twitch.tv/v1/badges/channels/{channel_id}/display"
+BTTV_GLOBAL_URL = "https://api.betterttv.net/3/cached/emotes/global"
+BTTV_CHANNEL_URL = "https://api.betterttv.net/3/cached/users/twitch/{room_id}"
+BTTV_EMOTE_URL = "https://cdn.betterttv.net/emote/{emote_id}/1x"
+FFZ_GLOBAL_URL = "https://api.frankerfacez.com/v1/set/global"
+FFZ_CHANNEL_URL = "https://api.frankerfacez.com/v1/room/id/{room_id}"
+SEVENTV_GLOBAL_URL = "https://7tv.io/v3/emote-sets/global"
+SEVENTV_CHANNEL_URL = "https://7tv.io/v3/users/twitch/{room_id}"
+SEVENTV_EMOTE_URL = "https://cdn.7tv.app/emote/{emote_id}/1x.webp"
+
+# Load shedding drops the lowest priorities first and never drops bits, highlights or system lines
+PRIORITY_VIEWER = 0
+PRIORITY_SUBSCRIBER = 1
+PRIORITY_MODERATOR = 2
+PRIORITY_BROADCASTER = 3
+PRIORITY_BITS = 4
+PRIORITY_HIGHLIGHT = 5
+PRIORITY_SYSTEM = 6
+
+ROLE_BROADCASTER = 1 << 0
+ROLE_MODERATOR = 1 << 1
+ROLE_VIP = 1 << 2
+ROLE_SUBSCRIBER = 1 << 3
+ROLE_PRIME = 1 << 4
+ROLE_PREMIUM = 1 << 5
+ROLE_SUBTEMBER = 1 << 6
+ROLE_COUNT = 7
+
+BADGE_ROLES = {
+    'broadcaster': ROLE_BROADCASTER,
+    'moderator': ROLE_MODERATOR,
+    'vip': ROLE_VIP,
+    'subscriber': ROLE_SUBSCRIBER,
+    'founder': ROLE_SUBSCRIBER,
+    'prime': ROLE_PRIME,
+    'premium': ROLE_PREMIUM,
+    'subtember': ROLE_SUBTEMBER
+}
+# Badge sets from the badge APIs that are not listed above are classified by name
+BADGE_ROLE_KEYWORDS = (
+    ('broadcaster', ROLE_BROADCASTER),
+    ('moderator', ROLE_MODERATOR),
+    ('vip', ROLE_VIP),
+    ('subscriber', ROLE_SUBSCRIBER),
+    ('founder', ROLE_SUBSCRIBER),
+    ('subtember', ROLE_SUBTEMBER)
+)
+ROLE_STYLE_ORDER = (
+    (ROLE_BROADCASTER, 'broadcaster'),
+    (ROLE_MODERATOR, 'moderator'),
+    (ROLE_VIP, 'vip'),
+    (ROLE_SUBSCRIBER, 'subscriber'),
+    (ROLE_PRIME, 'prime'),
+    (ROLE_PREMIUM, 'vip')
+)
+ROLE_ICON_ORDER = (
+    (ROLE_BROADCASTER, 'broadcaster'),
+    (ROLE_MODERATOR, 'moderator'),
+    (ROLE_VIP, 'vip'),
+    (ROLE_SUBSCRIBER, 'subscriber'),
+    (ROLE_PRIME, 'prime'),
+    (ROLE_SUBTEMBER, 'subtember')
+)
+
+def first_role_match(mask, order):
+    for role, name in order:
+        if mask & role:
+            return name
+    return None
+
+# Every role combination is resolved up front so rendering is a single tuple index
+ROLE_STYLES = tuple(first_role_match(mask, ROLE_STYLE_ORDER) for mask in range(1 << ROLE_COUNT))
+ROLE_ICONS = tuple(first_role_match(mask, ROLE_ICON_ORDER) for mask in range(1 << ROLE_COUNT))
+ROLE_PRIORITIES = tuple(
+    PRIORITY_BROADCASTER if mask & ROLE_BROADCASTER else
+    PRIORITY_MODERATOR if mask & ROLE_MODERATOR else
+    PRIORITY_SUBSCRIBER if mask & (ROLE_VIP | ROLE_SUBSCRIBER) else
+    PRIORITY_VIEWER
+    for mask in range(1 << ROLE_COUNT)
+)
+
+def build_badge_roles(*badge_sets):
+    """Map every known badge set name to its role bits, starting from BADGE_ROLES"""
+    roles = dict(BADGE_ROLES)
+    for sets in badge_sets:
+        for name in sets:
+            if name not in roles:
+                roles[name] = next((role for keyword, role in BADGE_ROLE_KEYWORDS if keyword in name), 0)
+    return roles
+
+def roles_from_badges(badge_info, badge_roles):
+    """Fold a raw badges tag value ('name/version,...') into a role bitmask"""
+    mask = 0
+    if badge_info:
+        for badge in badge_info.split(','):
+            mask |= badge_roles.get(badge.partition('/')[0], 0)
+    return mask
+
+RULE_ACTIONS = ('hide', 'highlight', 'color')
+RULE_COLOR = re.compile(r'#(?:[0-9a-fA-F]{3}){1,2}|[a-zA-Z ]+')
+
+def rule_strings(entry, key):
+    """A rule condition that must be a list of strings; a bare string would be matched letter by letter"""
+    values = entry.get(key, ())
+    if not isinstance(values, (list, tuple)) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"{key} must be a list of strings")
+    return values
+
+class Rule:
+    """One compiled filter rule; conditions that are empty always match"""
+
+    __slots__ = ('name', 'action', 'color', 'keywords', 'pattern', 'users', 'roles', 'platforms')
+
+    def __init__(self, entry, color_check=None):
+        self.name = entry.get('name')
+        self.action = entry.get('action', 'highlight')
+        if self.action not in RULE_ACTIONS:
+            raise ValueError(f"unknown action {self.action!r}")
+        self.color = entry.get('color')
+        if self.action == 'color' and not (isinstance(self.color, str) and RULE_COLOR.fullmatch(self.color)):
+            raise ValueError(f"invalid color {self.color!r}")
+        if self.action == 'color' and color_check and not color_check(self.color):
+            raise ValueError(f"unknown color {self.color!r}")
+
+        self.keywords = {keyword.strip().lower() for keyword in rule_strings(entry, 'keywords') if keyword.strip()}
+        self.pattern = re.compile(entry['regex'], re.IGNORECASE) if entry.get('regex') else None
+        self.users = {user.strip().lstrip('@').lower() for user in rule_strings(entry, 'users') if user.strip()}
+        self.roles = 0
+        for name in rule_strings(entry, 'roles'):
+            if name.lower() not in BADGE_ROLES:
+                raise ValueError(f"unknown role {name!r}")
+            self.roles |= BADGE_ROLES[name.lower()]
+        self.platforms = set(rule_strings(entry, 'platforms'))
+        if not (self.keywords or self.pattern or self.users or self.roles or self.platforms):
+            raise ValueError("no conditions")
+
+    def matches(self, record):
+        """Check every condition except keywords, which RuleSet matches for all rules at once"""
+        return bool((not self.users or (record.username or '').lower() in self.users)
+                    and (not self.roles or record.roles & self.roles)
+                    and (not self.platforms or record.platform in self.platforms)
+                    and (not self.pattern or self.pattern.search(record.message)))
+
+def trie_regex(words):
+    """An alternation of words nested as a trie, so the regex engine never tries words one by one"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # Optional groups are greedy, so the longest keyword is tried first and shorter ones on backtrack
+        return f"(?:{body})?" if '' in node else body
+
+    return build(trie)
+
+class RuleSet:
+    """User filter rules compiled for matching every chat message.
+
+    Keywords from every rule go into one case-insensitive trie regex, so a message is scanned
+    once however many keyword rules there are, and username conditions are a dict lookup.
+    Only rules with neither keywords nor usernames are checked against every message.
+    color_check, if given, is asked whether a color name can be displayed.
+    """
+
+    def __init__(self, config=(), color_check=None):
+        self.rules = []
+        self.errors = []
+        keyword_rules = {}
+        self.user_rules = {}
+        self.other_rules = []
+        for number, entry in enumerate(config, 1):
+            if not isinstance(entry, dict):
+                self.errors.append(f"rule {number}: not an object")
+                continue
+            if not entry.get('enabled', True):
+                continue
+            try:
+                rule = Rule(entry, color_check)
+            except (re.error, ValueError, TypeError, AttributeError) as e:
+                self.errors.append(f"rule {entry.get('name') or number}: {e}")
+                continue
+
+            index = len(self.rules)
+            self.rules.append(rule)
+            if rule.keywords:
+                for keyword in rule.keywords:
+                    keyword_rules.setdefault(keyword, []).append(index)
+            elif rule.users:
+                for user in rule.users:
+                    self.user_rules.setdefault(user, []).append(index)
+            else:
+                self.other_rules.append(index)
+
+        # A match reports only the longest keyword at a position, so it also stands for every
+        # keyword that is a whole-word prefix of it ('gg' inside 'gg wp')
+        self.keyword_rules = {}
+        for keyword, indices in keyword_rules.items():
+            indices = set(indices)
+            for end in range(1, len(keyword)):
+                if not (keyword[end].isalnum() or keyword[end] == '_'):
+                    indices.update(keyword_rules.get(keyword[:end], ()))
+            self.keyword_rules[keyword] = tuple(sorted(indices))
+        self.keyword_pattern = None
+        if keyword_rules:
+            # The lookahead lets matches overlap, so 'wp' is still found after 'gg wp' has matched
+            self.keyword_pattern = re.compile(rf"(?<!\w)(?=({trie_regex(keyword_rules)})(?!\w))", re.IGNORECASE)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, record):
+        """Indices of the rules whose keyword or username index points at record, plus the rest"""
+        found = list(self.other_rules)
+        if self.keyword_pattern:
+            for match in self.keyword_pattern.finditer(record.message):
+                found.extend(self.keyword_rules.get(match.group(1).lower(), ()))
+        if self.user_rules:
+            found.extend(self.user_rules.get((record.username or '').lower(), ()))
+        return found
+
+    def apply(self, record):
+        """Apply matching rules in order to a chat record; returns False, and marks it hidden, if it should be hidden"""
+        candidates = self.candidates(record)
+        if not candidates:
+            return True
+        for index in sorted(set(candidates)):
+            rule = self.rules[index]
+            if not rule.matches(record):
+                continue
+            if rule.action == 'hide':
+                record.hidden = True
+                return False
+            if rule.action == 'highlight':
+                record.is_highlight = True
+            elif record.rule_color is None:
+                record.rule_color = rule.color
+        return True
+
+EMOTE_LAYOUT_CACHE_SIZE = 2000
+HTTP_TIMEOUT = 10
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 10
+RECORD_FLUSH_INTERVAL = 5.0
+REPLAY_CHUNK = 1000
+METRICS_EXPORT_INTERVAL = 10.0
+HISTORY_BATCH_SIZE = 500
+HISTORY_FLUSH_INTERVAL = 1.0
+HISTORY_MAX_AGE = 30 * 24 * 3600
+HISTORY_SEARCH_LIMIT = 500
+
+def get_config_path():
+    appdata = os.getenv('APPDATA')
+    if appdata:
+        config_dir = os.path.join(appdata, 'Chat')
+        os.makedirs(config_dir, exist_ok=True)
+        return os.path.join(config_dir, 'config.json')
+    return 'chat_settings.json'
+
+def get_cache_dir():
+    config_dir = os.path.dirname(get_config_path())
+    cache_dir = os.path.join(config_dir, 'cache') if config_dir else 'chat_cache'
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def get_history_path():
+    config_dir = os.path.dirname(get_config_path())
+    return os.path.join(config_dir, 'history.db') if config_dir else 'chat_history.db'
+
+SETTINGS_FILE = get_config_path()
+
+def read_settings():
+    """Return the saved settings, or an empty dict before the first save"""
+    if not os.path.exists(SETTINGS_FILE):
+        return {}
+    with open(SETTINGS_FILE, 'r') as f:
+        return json.load(f)
+
+class LRUCache:
+    """A bounded dict that evicts the least recently used entry"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __getitem__(self, key):
+        value = self.items[key]
+        self.items.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        if key in self.items:
+            self.hits += 1
+            return self[key]
+        self.misses += 1
+        return default
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+def import_timed(name, metrics=None):
+    """Import a module on first use, recording how long that first import took"""
+    module = sys.modules.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        if metrics:
+            metrics.observe(f"import_{name}", time.perf_counter() - started)
+    return module
+
+class HttpClient:
+    """Shared keep-alive HTTP session with default timeouts, retry with backoff and per-host latency stats"""
+
+    def __init__(self, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self.session_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.latency = {}
+
+    @property
+    def session(self):
+        """The requests session, built on first use so requests stays off the startup path"""
+        if self._session is None:
+            with self.session_lock:
+                if self._session is None:
+                    self._session = self.create_session()
+        return self._session
+
+    def create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        session = requests.Session()
+        retry = Retry(
+            total=self.retries, backoff_factor=self.backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True, raise_on_status=False
+        )
+        # One connection pool per host (static-cdn, api.twitch.tv, googleapis, ...) reused across calls
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get(self, url, timeout=None, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+            failed = response.status_code >= 400 and response.status_code != 404
+            return response
+        finally:
+            self.record(urlparse(url).netloc, (time.perf_counter() - started) * 1000, failed)
+
+    def record(self, host, elapsed_ms, failed):
+        with self.lock:
+            stats = self.latency.setdefault(host, {'requests': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['requests'] += 1
+            stats['errors'] += failed
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def stats(self):
+        with self.lock:
+            return {
+                host: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'avg_ms': stats['total_ms'] / stats['requests'],
+                    'max_ms': stats['max_ms']
+                }
+                for host, stats in self.latency.items()
+            }
+
+    def gauges(self):
+        """stats() flattened into Metrics gauges named http_<host>_<stat>"""
+        gauges = {}
+        for host, stats in self.stats().items():
+            host = re.sub(r'\W', '_', host)
+            for name, value in stats.items():
+                gauges[f"http_{host}_{name}"] = value
+        return gauges
+
+    def close(self):
+        if self._session:
+            self._session.close()
+
+class Metrics:
+    """Per-stage timings and counters, cheap enough to leave on.
+
+    A stage keeps a count, total and maximum instead of samples, so recording one costs a lock
+    and a few additions. Gauges are pulled from collectors only when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.stages = {}
+        self.counters = {}
+        self.collectors = ()
+
+    def observe(self, stage, seconds, count=1, longest=None):
+        """Add count events that took seconds in total; longest defaults to their mean"""
+        if longest is None:
+            longest = seconds / count if count else 0.0
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = [0, 0.0, 0.0]
+            entry[0] += count
+            entry[1] += seconds
+            if longest > entry[2]:
+                entry[2] = longest
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_collector(self, collect):
+        """Call collect() for a dict of gauge values on every snapshot"""
+        self.collectors = self.collectors + (collect,)
+
+    def stage_totals(self):
+        """(count, total seconds) per stage, for callers that diff two readings"""
+        with self.lock:
+            return {stage: (entry[0], entry[1]) for stage, entry in self.stages.items()}
+
+    def snapshot(self):
+        gauges = {}
+        for collect in self.collectors:
+            try:
+                gauges.update(collect())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        with self.lock:
+            return {
+                'time': time.time(),
+                'uptime': time.monotonic() - self.started,
+                'stages': {
+                    stage: {
+                        'count': count,
+                        'total_ms': total * 1000,
+                        'avg_ms': total * 1000 / count if count else 0.0,
+                        'max_ms': longest * 1000
+                    }
+                    for stage, (count, total, longest) in self.stages.items()
+                },
+                'counters': dict(self.counters),
+                'gauges': gauges
+            }
+
+def format_prometheus(snapshot, prefix='chat'):
+    """Render a Metrics snapshot in the Prometheus text exposition format"""
+    stages = sorted(snapshot['stages'].items())
+    lines = [f"# TYPE {prefix}_stage_seconds summary"]
+    for stage, stats in stages:
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["total_ms"] / 1000:.6f}')
+    lines.append(f"# TYPE {prefix}_stage_max_seconds gauge")
+    for stage, stats in stages:
+        lines.append(f'{prefix}_stage_max_seconds{{stage="{stage}"}} {stats["max_ms"] / 1000:.6f}')
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    for name, value in sorted(snapshot['gauges'].items()):
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    lines.append(f"# TYPE {prefix}_uptime_seconds gauge")
+    lines.append(f"{prefix}_uptime_seconds {snapshot['uptime']:.3f}")
+    return '\n'.join(lines) + '\n'
+
+def write_metrics(path, snapshot):
+    """Replace path with a snapshot: Prometheus text for a .prom file, JSON otherwise"""
+    text = format_prometheus(snapshot) if path.endswith('.prom') else json.dumps(snapshot, indent=2)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+class YouTubeResolver:
+    """Channel handle to channel ID to live video ID lookups with caching and quota accounting.
+
+    Channel IDs never change, so resolved handles and names are kept on disk without
+    expiry. Live video IDs are cached briefly so reconnects skip the lookup, and the quota
+    cost of every Data API call is added to a counter that resets each day.
+    """
+
+    def __init__(self, http, path, live_ttl=YOUTUBE_LIVE_CACHE_TTL, miss_ttl=YOUTUBE_LIVE_MISS_TTL):
+        self.http = http
+        self.path = path
+        self.live_ttl = live_ttl
+        self.miss_ttl = miss_ttl
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.live = {}
+        self.quota_day = None
+        self.quota = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.channels = data.get('channels', {})
+            self.quota_day = data.get('quota_day')
+            self.quota = data.get('quota', 0)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self.lock:
+            data = {'channels': dict(self.channels), 'quota_day': self.quota_day, 'quota': self.quota}
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+        except OSError as e:
+            print(f"Error saving YouTube cache: {e}")
+
+    @property
+    def quota_used(self):
+        """Quota units spent today"""
+        return self.quota if self.quota_day == datetime.now(YOUTUBE_QUOTA_TZ).date().isoformat() else 0
+
+    def request(self, endpoint, api_key, **params):
+        """Call one Data API endpoint and charge its quota cost; raises on API errors"""
+        today = datetime.now(YOUTUBE_QUOTA_TZ).date().isoformat()
+        with self.lock:
+            if self.quota_day != today:
+                self.quota_day = today
+                self.quota = 0
+            # Failed and rejected calls are charged too
+            self.quota += YOUTUBE_QUOTA_COSTS.get(endpoint, 1)
+        try:
+            response = self.http.get(f"{YOUTUBE_API_BASE}/{endpoint}", params={**params, 'key': api_key})
+            data = response.json()
+        finally:
+            # Calls are rare next to the daily quota, so the count is saved on every one
+            self.save()
+        if 'error' in data:
+            raise RuntimeError(data['error'].get('message', 'request failed'))
+        return data
+
+    def resolve_channel(self, channel_input, api_key):
+        """Return the channel ID for a UC... ID, @handle or channel name, or None"""
+        channel_input = channel_input.strip()
+        if channel_input.startswith('UC') and len(channel_input) == 24:
+            return channel_input
+        key = channel_input.lower()
+        channel_id = self.channels.get(key)
+        if channel_id:
+            return channel_id
+
+        handle = channel_input if channel_input.startswith('@') else '@' + channel_input
+        items = self.request('channels', api_key, part='id', forHandle=handle).get('items')
+        if items:
+            channel_id = items[0]['id']
+        else:
+            # Not a handle: fall back to a channel search, which costs 100 units
+            items = self.request('search', api_key, part='snippet', q=channel_input.lstrip('@'),
+                                 type='channel', maxResults=1).get('items')
+            if not items:
+                return None
+            channel_id = items[0]['snippet']['channelId']
+
+        with self.lock:
+            self.channels[key] = channel_id
+        self.save()
+        return channel_id
+
+    def live_video(self, channel_id, api_key):
+        """Return the channel's current live video ID, or None if it is not live"""
+        cached = self.live.get(channel_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        # The uploads playlist is the channel ID with UC swapped for UU, so it needs no lookup
+        uploads = 'UU' + channel_id[2:]
+        items = self.request('playlistItems', api_key, part='contentDetails',
+                             playlistId=uploads, maxResults=10).get('items', [])
+        video_ids = [item['contentDetails']['videoId'] for item in items]
+        video_id = None
+        if video_ids:
+            videos = self.request('videos', api_key, part='snippet', id=','.join(video_ids)).get('items', [])
+            video_id = next((video['id'] for video in videos
+                             if video['snippet'].get('liveBroadcastContent') == 'live'), None)
+        if video_id is None and not cached:
+            # Streams can be missing from uploads briefly; only pay for a search on a fresh lookup
+            items = self.request('search', api_key, part='snippet', channelId=channel_id,
+                                 eventType='live', type='video', maxResults=1).get('items')
+            if items:
+                video_id = items[0]['id']['videoId']
+
+        ttl = self.live_ttl if video_id else self.miss_ttl
+        self.live[channel_id] = (video_id, time.monotonic() + ttl)
+        return video_id
+
+def parse_bttv_emotes(data):
+    """(code, emote_id, image_url) for a BTTV global list or channel user response"""
+    if isinstance(data, dict):
+        data = data.get('channelEmotes', []) + data.get('sharedEmotes', [])
+    return [(emote['code'], emote['id'], BTTV_EMOTE_URL.format(emote_id=emote['id'])) for emote in data]
+
+def parse_ffz_emotes(data):
+    """(code, emote_id, image_url) for an FFZ global set or room response"""
+    emotes = []
+    default_sets = {str(set_id) for set_id in data.get('default_sets', ())}
+    for set_id, emote_set in data.get('sets', {}).items():
+        # The global response also lists opt-in sets; only the default ones apply to everyone
+        if default_sets and set_id not in default_sets:
+            continue
+        for emote in emote_set.get('emoticons', ()):
+            url = emote.get('urls', {}).get('1')
+            if url:
+                emotes.append((emote['name'], str(emote['id']), 'https:' + url if url.startswith('//') else url))
+    return emotes
+
+def parse_7tv_emotes(data):
+    """(code, emote_id, image_url) for a 7TV emote set or Twitch user response"""
+    emotes = []
+    if 'emote_set' in data:
+        data = data['emote_set'] or {}
+    for emote in data.get('emotes') or ():
+        url = SEVENTV_EMOTE_URL.format(emote_id=emote['id'])
+        host = (emote.get('data') or {}).get('host')
+        if host:
+            names = [f['name'] for f in host.get('files', ())]
+            for name in ('1x.png', '1x.gif', '1x.webp'):
+                if name in names:
+                    url = f"https:{host['url']}/{name}"
+                    break
+        emotes.append((emote['name'], emote['id'], url))
+    return emotes
+
+# Later providers win when two define the same word, and channel sets win over global ones
+EMOTE_PROVIDERS = (
+    ('bttv', BTTV_GLOBAL_URL, BTTV_CHANNEL_URL, parse_bttv_emotes),
+    ('ffz', FFZ_GLOBAL_URL, FFZ_CHANNEL_URL, parse_ffz_emotes),
+    ('7tv', SEVENTV_GLOBAL_URL, SEVENTV_CHANNEL_URL, parse_7tv_emotes)
+)
+
+class EmoteProviders:
+    """BTTV, FFZ and 7TV emote sets merged into one word index per Twitch room.
+
+    Each index maps an emote word to a key of the form '<provider>:<id>', which is used
+    like a Twitch emote ID for the image caches. With fixture_dir set, sets are read from
+    <provider>_global.json and <provider>_<room id>.json there instead of the network.
+    """
+
+    def __init__(self, http, fixture_dir=None):
+        self.http = http
+        self.fixture_dir = fixture_dir
+        self.global_emotes = None
+        self.channel_emotes = {}
+        self.indexes = {}
+        self.image_urls = {}
+        self.lock = threading.Lock()
+
+    def fetch_json(self, provider, scope, url):
+        """Return the decoded response for one provider set, or None if there is none"""
+        if self.fixture_dir:
+            path = os.path.join(self.fixture_dir, f"{provider}_{scope}.json")
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        response = self.http.get(url)
+        # 404 means the channel has no account with this provider
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def load_set(self, scope):
+        """Merge every provider's emotes for scope ('global' or a room ID) into {word: key}"""
+        emotes = {}
+        for provider, global_url, channel_url, parse in EMOTE_PROVIDERS:
+            url = global_url if scope == 'global' else channel_url.format(room_id=scope)
+            try:
+                data = self.fetch_json(provider, scope, url)
+                if data is None:
+                    continue
+                for code, emote_id, image_url in parse(data):
+                    key = f"{provider}:{emote_id}"
+                    emotes[code] = key
+                    self.image_urls[key] = image_url
+            except Exception as e:
+                print(f"Error loading {provider} emotes for {scope}: {e}")
+        return emotes
+
+    def load_global(self):
+        """Load the global sets once; safe to run off the Tk thread"""
+        if self.global_emotes is not None:
+            return False
+        emotes = self.load_set('global')
+        with self.lock:
+            self.global_emotes = emotes
+            self.indexes = {room_id: {**emotes, **channel} for room_id, channel in self.channel_emotes.items()}
+        return True
+
+    def load_channel(self, room_id):
+        """Load the sets for one room once; returns True if the index changed"""
+        if room_id in self.channel_emotes:
+            return False
+        emotes = self.load_set(room_id)
+        with self.lock:
+            self.channel_emotes[room_id] = emotes
+            self.indexes[room_id] = {**(self.global_emotes or {}), **emotes}
+        return True
+
+    def index(self, room_id=None):
+        """The word index for room_id, falling back to the global sets"""
+        return self.indexes.get(room_id) or self.global_emotes or {}
+
+    def image_url(self, key):
+        return self.image_urls.get(key)
+
+class IRCLineFramer:
+    """Reassemble complete IRC lines from arbitrarily split socket reads"""
+
+    def __init__(self):
+        # The incremental decoder holds back multibyte UTF-8 sequences split across reads
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.partial = ''
+
+    def feed(self, data):
+        """Yield every line completed by data, keeping any trailing partial line"""
+        text = self.decoder.decode(data)
+        if not text:
+            return
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            line = line.rstrip('\r')
+            if line:
+                yield line
+
+IRC_TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+DONATION_KEYWORDS = ('donated', 'donation', 'cheered')
+
+def mentions_donation(message):
+    """Whether message contains one of DONATION_KEYWORDS, ignoring case.
+
+    Substring search beats a compiled alternation here, so this lowers the message once and
+    only looks for the two 'donat...' keywords when their shared prefix is present.
+    """
+    lowered = message.lower()
+    return 'cheered' in lowered or ('donat' in lowered and ('donated' in lowered or 'donation' in lowered))
+
+def unescape_tag_value(value):
+    """Unescape an IRCv3 tag value"""
+    if '\\' not in value:
+        return value
+    out = []
+    i = 0
+    length = len(value)
+    while i < length:
+        ch = value[i]
+        if ch == '\\':
+            i += 1
+            if i < length:
+                out.append(IRC_TAG_ESCAPES.get(value[i], value[i]))
+        else:
+            out.append(ch)
+        i += 1
+    return ''.join(out)
+
+class TwitchMessage:
+    """A parsed PRIVMSG whose tags are only split and unescaped when first accessed
+
+    raw_tags is the undecoded tag string with its '@' replaced by a leading ';'.
+    """
+
+    __slots__ = ('raw_tags', 'username', 'channel', 'message', 'roles', '_tags')
+
+    def __init__(self, raw_tags, username, channel, message):
+        self.raw_tags = raw_tags
+        self.username = username
+        self.channel = channel
+        self.message = message
+        self.roles = 0
+        self._tags = None
+
+    @property
+    def tags(self):
+        if self._tags is None:
+            tags = {}
+            if self.raw_tags:
+                for tag in self.raw_tags[1:].split(';'):
+                    key, sep, value = tag.partition('=')
+                    if sep:
+                        tags[key] = unescape_tag_value(value)
+            self._tags = tags
+        return self._tags
+
+    def tag(self, key, default=None):
+        """Look up a single tag without splitting the rest of the tag string"""
+        if self._tags is not None:
+            return self._tags.get(key, default)
+        raw = self.raw_tags
+        start = raw.find(f';{key}=')
+        if start < 0:
+            return default
+        start += len(key) + 2
+        end = raw.find(';', start)
+        value = raw[start:] if end < 0 else raw[start:end]
+        return unescape_tag_value(value) if '\\' in value else value
+
+    @property
+    def color(self):
+        color = self.tag('color')
+        if color and not color.startswith('#'):
+            color = f'#{color}'
+        return color or None
+
+    @property
+    def badges(self):
+        badges = []
+        badge_info = self.tag('badges')
+        if badge_info:
+            for badge in badge_info.split(','):
+                badge_name, sep, badge_version = badge.partition('/')
+                if sep:
+                    badges.append((badge_name, badge_version))
+        return badges
+
+    @property
+    def emotes(self):
+        emotes = []
+        emote_info = self.tag('emotes')
+        if emote_info:
+            for emote in emote_info.split('/'):
+                emote_id, sep, positions = emote.partition(':')
+                if sep and positions:
+                    emotes.append((emote_id, positions.split(',')))
+        return emotes
+
+    @property
+    def bits(self):
+        bits = self.tag('bits')
+        if bits:
+            try:
+                return int(bits)
+            except ValueError:
+                pass
+        return 0
+
+    @property
+    def is_donation(self):
+        return bool(self.bits) or mentions_donation(self.message)
+
+    @property
+    def is_highlight(self):
+        return self.tag('msg-id') == 'highlighted-message'
+
+def parse_twitch_line(line):
+    """Parse a raw IRC line in one pass, returning a TwitchMessage for non-empty PRIVMSGs only"""
+    raw_tags = ''
+    pos = 0
+    if line.startswith('@'):
+        pos = line.find(' ')
+        if pos < 0:
+            return None
+        # Keep a leading ';' so every tag, including the first, is found by searching for ';key='
+        raw_tags = ';' + line[1:pos]
+        pos += 1
+
+    if not line.startswith(':', pos):
+        return None
+    prefix_end = line.find(' ', pos)
+    if prefix_end < 0 or not line.startswith('PRIVMSG #', prefix_end + 1):
+        return None
+
+    bang = line.find('!', pos, prefix_end)
+    if bang <= pos + 1:
+        return None
+
+    channel_start = prefix_end + 10
+    channel_end = line.find(' :', channel_start)
+    if channel_end < 0:
+        return None
+
+    message = line[channel_end + 2:]
+    if not message:
+        return None
+    return TwitchMessage(raw_tags, line[pos + 1:bang], line[channel_start:channel_end], message)
+
+def match_emote_words(text, word_index):
+    """Split text into (text, emote_id) segments for the space-separated words found in word_index"""
+    if not word_index:
+        return ((text, None),)
+    segments = []
+    start = 0
+    pos = 0
+    for word in text.split(' '):
+        end = pos + len(word)
+        emote_id = word_index.get(word)
+        if emote_id is not None:
+            if pos > start:
+                segments.append((text[start:pos], None))
+            segments.append((word, emote_id))
+            start = end
+        pos = end + 1
+    if start < len(text):
+        segments.append((text[start:], None))
+    return tuple(segments)
+
+def layout_emotes(message, emote_info, word_index=None):
+    """Split a message into (text, emote_id) segments using a raw Twitch emotes tag value.
+
+    Twitch counts positions in Unicode code points, which is also how Python indexes str,
+    so the ranges slice the message directly. Overlapping or out-of-range positions are
+    skipped. Plain text is matched against word_index for third-party emotes, and what
+    remains has an emote_id of None.
+    """
+    positions = []
+    for emote in emote_info.split('/'):
+        emote_id, sep, ranges = emote.partition(':')
+        if not sep:
+            continue
+        for span in ranges.split(','):
+            start, _, end = span.partition('-')
+            try:
+                positions.append((int(start), int(end), emote_id))
+            except ValueError:
+                continue
+    positions.sort()
+
+    segments = []
+    last_pos = 0
+    length = len(message)
+    for start, end, emote_id in positions:
+        if start < last_pos or end < start or end >= length:
+            continue
+        if start > last_pos:
+            segments.extend(match_emote_words(message[last_pos:start], word_index))
+        segments.append((message[start:end + 1], emote_id))
+        last_pos = end + 1
+    if last_pos < length:
+        segments.extend(match_emote_words(message[last_pos:], word_index))
+    return tuple(segments)
+
+async def aiter_irc_lines(reader, bufsize=TWITCH_RECV_BUFFER, metrics=None):
+    """Yield complete IRC lines read from an asyncio stream until the connection closes"""
+    framer = IRCLineFramer()
+    while True:
+        data = await reader.read(bufsize)
+        if not data:
+            return
+        if metrics:
+            # Time decoding and framing only; waiting for the socket is idle time
+            started = time.perf_counter()
+            lines = list(framer.feed(data))
+            metrics.observe('receive', time.perf_counter() - started, len(lines))
+            metrics.count('bytes_received', len(data))
+        else:
+            lines = framer.feed(data)
+        for line in lines:
+            yield line
+
+class SessionFinished(Exception):
+    """Raised by a connection attempt when the session should stop rather than reconnect"""
+
+class ConnectionState:
+    """Backoff and uptime bookkeeping for one supervised connection"""
+
+    def __init__(self, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt = 0
+        self.ever_connected = False
+        self.connected_at = None
+        self.down_since = None
+        self.messages = 0
+        self.rate = 0.0
+
+    def connected(self):
+        """Mark the connection live; returns (seconds down, estimated missed messages) after an outage"""
+        now = time.monotonic()
+        self.ever_connected = True
+        self.connected_at = now
+        self.messages = 0
+        if self.down_since is None:
+            return None
+        gap = now - self.down_since
+        self.down_since = None
+        return gap, round(gap * self.rate)
+
+    def disconnected(self):
+        now = time.monotonic()
+        if self.connected_at is not None:
+            uptime = now - self.connected_at
+            if uptime > 0:
+                self.rate = self.messages / uptime
+            # Only a connection that stayed up or carried chat resets the backoff; one the server
+            # accepts and drops straight away would otherwise be retried within a second forever
+            if uptime >= RECONNECT_STABLE_TIME or self.messages:
+                self.attempt = 0
+            self.connected_at = None
+        if self.down_since is None:
+            self.down_since = now
+
+    def next_delay(self):
+        """Equal-jitter exponential backoff: between half and all of the current step"""
+        delay = min(self.max_delay, self.base_delay * (2 ** self.attempt))
+        self.attempt += 1
+        return random.uniform(delay / 2, delay)
+
+CHAT_RECORD_FIELDS = ('kind', 'timestamp', 'platform', 'channel', 'username', 'message', 'color', 'roles',
+                       'is_donation', 'is_highlight', 'bits', 'emotes', 'rule_color')
+
+class ChatRecord:
+    """One chat or system line, the same shape for every platform.
+
+    emotes is None for plain text, or the whole message as a tuple of (text, emote_id)
+    segments with an emote_id of None for plain text.
+    """
+
+    __slots__ = ('kind', 'timestamp', 'platform', 'username', 'message', 'color',
+                 'is_donation', 'is_highlight', 'bits', 'emotes', 'channel', 'queued_at',
+                 'roles', 'rule_color', 'hidden')
+
+    def __init__(self, kind, timestamp, platform, username, message, color=None,
+                 is_donation=False, is_highlight=False, bits=0, emotes=None, channel=None, roles=0):
+        self.kind = kind
+        self.timestamp = timestamp
+        self.platform = platform
+        self.username = username
+        self.message = message
+        self.color = color
+        self.is_donation = is_donation
+        self.is_highlight = is_highlight
+        self.bits = bits
+        self.emotes = emotes
+        self.channel = channel
+        self.queued_at = time.monotonic()
+        self.roles = roles
+        self.rule_color = None
+        self.hidden = False
+
+    def priority(self):
+        """Shedding priority; higher values are kept longer under load"""
+        if self.kind == 'system':
+            return PRIORITY_SYSTEM
+        if self.is_highlight:
+            return PRIORITY_HIGHLIGHT
+        if self.is_donation or self.bits:
+            return PRIORITY_BITS
+        return ROLE_PRIORITIES[self.roles]
+
+    def size(self):
+        """Approximate rendered length, used for scrollback accounting"""
+        return len(self.timestamp) + len(self.username or '') + len(self.message) + 6
+
+    def as_dict(self):
+        """The normalized fields as a plain dict, for JSON output"""
+        return {field: getattr(self, field) for field in CHAT_RECORD_FIELDS}
+
+class AsyncEngine:
+    """A single background asyncio loop that owns every chat connection"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, daemon=True, name='chat-engine')
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop; cancelling the returned future cancels the task"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout=1.0):
+        """Cancel every task, give them up to timeout seconds to clean up, then stop the loop"""
+        try:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout)
+        except Exception:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+class ChatRecorder:
+    """Append-only, gzip-compressed log of raw Twitch IRC lines and YouTube pytchat items.
+
+    Each line is '<unix time>\t<source>\t<payload>', where source is 'twitch' with the raw
+    IRC line as payload, or 'youtube' with the pytchat item as JSON. Every recording session
+    appends a new gzip member, so the file stays readable while it grows and can be streamed.
+    """
+
+    def __init__(self, path, flush_interval=RECORD_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.file = gzip.open(path, 'at', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.count = 0
+
+    def record(self, source, payload, timestamp=None):
+        line = f"{time.time() if timestamp is None else timestamp:.3f}\t{source}\t{payload}\n"
+        with self.lock:
+            self.file.write(line)
+            self.count += 1
+            now = time.monotonic()
+            if now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_recording(path):
+    """Yield (unix time, source, payload) from a ChatRecorder log, streaming from disk.
+
+    A recording that is still being written, or was cut off by a crash, has no end-of-stream
+    marker; reading stops at its last complete line.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                timestamp, source, payload = line.rstrip('\n').split('\t', 2)
+                yield float(timestamp), source, payload
+        except EOFError:
+            pass
+
+def youtube_item_from_json(payload):
+    """Rebuild a recorded pytchat item with the attributes youtube_record reads"""
+    data = json.loads(payload)
+    item = SimpleNamespace(**data)
+    item.author = SimpleNamespace(**data['author'])
+    return item
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    platform TEXT,
+    channel TEXT,
+    username TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_time ON messages(time);
+CREATE INDEX IF NOT EXISTS messages_username ON messages(username COLLATE NOCASE);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(message, username, content='messages', content_rowid='id', prefix='2 3');
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, message, username) VALUES (new.id, new.message, new.username);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, message, username) VALUES ('delete', old.id, old.message, old.username);
+END;
+"""
+
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+def fts_query(text, username=None):
+    """Quote each word so user input cannot be read as FTS5 syntax; the last word matches as a prefix.
+
+    A username is matched in the index too, so FTS intersects both posting lists instead of
+    SQLite filtering every message that contains the words.
+    """
+    words = [fts_phrase(word) for word in text.split()]
+    words[-1] += '*'
+    query = f"message : ({' '.join(words)})"
+    if username:
+        query += f" AND username : {fts_phrase(username)}"
+    return query
+
+class ChatHistory:
+    """Every chat message in a local SQLite database with a full-text index on the message.
+
+    add() only queues rows; one background thread inserts them in batches, so subscribers
+    never wait on the disk. The database is in WAL mode, so searches run on their own
+    connection while the writer is busy.
+    """
+
+    def __init__(self, path, batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL,
+                 max_age=HISTORY_MAX_AGE, metrics=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.metrics = metrics
+        self.queue = queue.Queue()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(HISTORY_SCHEMA)
+        self.reader = sqlite3.connect(path, check_same_thread=False)
+        self.read_lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self.run, daemon=True, name='history')
+        self.thread.start()
+
+    def add(self, records):
+        """Queue the chat records in a published batch; safe to call from any thread"""
+        now = time.time()
+        rows = [(now, record.platform, record.channel, record.username, record.message)
+                for record in records if record.kind == 'chat']
+        if rows:
+            self.queue.put(rows)
+
+    def run(self):
+        if self.max_age:
+            self.prune(time.time() - self.max_age)
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                break
+            # Collect whatever else arrives within flush_interval into the same transaction
+            deadline = time.monotonic() + self.flush_interval
+            closing = False
+            while len(rows) < self.batch_size:
+                try:
+                    more = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if more is None:
+                    closing = True
+                    break
+                rows.extend(more)
+            self.write(rows)
+            if closing:
+                break
+        self.conn.close()
+
+    def write(self, rows):
+        started = time.perf_counter()
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO messages (time, platform, channel, username, message) VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"Error writing chat history: {e}")
+            return
+        if self.metrics:
+            self.metrics.observe('history_write', time.perf_counter() - started, len(rows))
+
+    def prune(self, before):
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM messages WHERE time < ?", (before,))
+        except sqlite3.Error as e:
+            print(f"Error pruning chat history: {e}")
+
+    def search(self, text='', username=None, platform=None, since=None, until=None, limit=HISTORY_SEARCH_LIMIT):
+        """Newest-first (time, platform, channel, username, message) rows matching every given filter"""
+        if text.strip():
+            source = "messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+            clauses = ["messages_fts MATCH ?"]
+            params = [fts_query(text, username)]
+            order = "messages_fts.rowid"
+            # IDs follow arrival order, so a time range is also an ID range FTS can seek to
+            if since is not None:
+                clauses.append("messages_fts.rowid >= coalesce("
+                               "(SELECT id FROM messages WHERE time >= ? ORDER BY time LIMIT 1), 1 << 62)")
+                params.append(since)
+            if until is not None:
+                clauses.append("messages_fts.rowid < coalesce("
+                               "(SELECT id FROM messages WHERE time >= ? ORDER BY time LIMIT 1), 1 << 62)")
+                params.append(until)
+        else:
+            source = "messages m"
+            clauses = []
+            params = []
+            order = "m.id"
+        if username:
+            clauses.append("m.username = ? COLLATE NOCASE")
+            params.append(username)
+        if platform:
+            clauses.append("m.platform = ?")
+            params.append(platform)
+        if since is not None:
+            clauses.append("m.time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("m.time < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (f"SELECT m.time, m.platform, m.channel, m.username, m.message FROM {source} "
+               f"{where} ORDER BY {order} DESC LIMIT ?")
+        params.append(limit)
+
+        started = time.perf_counter()
+        with self.read_lock:
+            rows = self.reader.execute(sql, params).fetchall()
+        if self.metrics:
+            self.metrics.observe('history_search', time.perf_counter() - started)
+        return rows
+
+    def close(self, timeout=5.0):
+        """Flush queued rows and close the database"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+        with self.read_lock:
+            self.reader.close()
+
+class ChatEngine:
+    """Twitch and YouTube connections, parsing and normalization into ChatRecords, with no UI.
+
+    Consumers subscribe to batches of records and watch for session events. Both callbacks
+    run on engine or worker threads, so a UI has to hand them over to its own thread.
+    """
+
+    def __init__(self, emote_fixture_dir=None):
+        self.http = HttpClient()
+        self.engine = AsyncEngine()
+        self.subscribers = ()
+        self.watchers = ()
+
+        self.twitch_token = None
+        self.twitch_channels = []
+        self.twitch_channel_ids = {}
+        self.twitch_recv_buffer = TWITCH_RECV_BUFFER
+        self.twitch_writer = None
+        self.rules = RuleSet()
+        self.rule_config = []
+        # Set by a frontend that can tell which color names it is able to display
+        self.rule_color_check = None
+        self.global_badges = {}
+        self.channel_badges = {}
+        self.badge_roles = dict(BADGE_ROLES)
+        self.emote_providers = EmoteProviders(self.http, emote_fixture_dir)
+        self.emote_layouts = LRUCache(EMOTE_LAYOUT_CACHE_SIZE)
+
+        self.youtube_api_key = None
+        self.youtube_video_id = None
+        self.youtube_chat = None
+        self.youtube_emoji_urls = {}
+        self.youtube_resolver = YouTubeResolver(self.http, os.path.join(get_cache_dir(), 'youtube.json'))
+
+        self.connected_services = {'twitch': False, 'youtube': False, 'replay': False}
+        self.service_tasks = {'twitch': None, 'youtube': None, 'replay': None}
+        self.service_sessions = {'twitch': 0, 'youtube': 0, 'replay': 0}
+        self.connection_states = {}
+        self.recorder = None
+
+        self.metrics = Metrics()
+        self.metrics.add_collector(lambda: {'youtube_quota_used': self.youtube_resolver.quota_used})
+        self.metrics.add_collector(self.http.gauges)
+        self.metrics.add_collector(lambda: {'emote_layout_hit_ratio': self.emote_layouts.hit_ratio()})
+        self.metrics_task = None
+        self.history = None
+        self.unsubscribe_history = None
+
+    def subscribe(self, callback):
+        """Call callback(records) with every batch of new ChatRecords; returns a function that unsubscribes.
+
+        Records a hide rule matched are still delivered, with hidden set, so history keeps them;
+        subscribers that display chat skip those.
+        """
+        # Copy on write, so publishing never needs a lock
+        self.subscribers = self.subscribers + (callback,)
+        return lambda: setattr(self, 'subscribers', tuple(s for s in self.subscribers if s is not callback))
+
+    def watch(self, callback):
+        """Call callback(event, platform, detail) on session events; returns a function that stops watching.
+
+        Events are 'status' when connection details change, 'emotes' when an emote index
+        changes and 'ended' when a session stops on its own, with the session ID as detail.
+        """
+        self.watchers = self.watchers + (callback,)
+        return lambda: setattr(self, 'watchers', tuple(w for w in self.watchers if w is not callback))
+
+    def publish(self, records):
+        rules = self.rules
+        if rules.rules:
+            started = time.perf_counter()
+            hidden = sum(1 for record in records if record.kind == 'chat' and not rules.apply(record))
+            self.metrics.observe('rules', time.perf_counter() - started, len(records))
+            if hidden:
+                self.metrics.count('hidden', hidden)
+        self.metrics.count('records', len(records))
+        for callback in self.subscribers:
+            try:
+                callback(records)
+            except Exception as e:
+                # A broken consumer must not take the connection down with it
+                print(f"Error in chat subscriber: {e}")
+
+    def twitch_record(self, msg):
+        """Normalize a parsed TwitchMessage into a ChatRecord"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        # Cheers carry a bits tag, so the keyword scan only runs for messages without one
+        bits = msg.bits
+        return ChatRecord('chat', timestamp, 'twitch', msg.username, msg.message, msg.color,
+                          is_donation=bool(bits) or mentions_donation(msg.message),
+                          is_highlight=msg.is_highlight, bits=bits,
+                          emotes=self.emote_segments(msg.tag('emotes'), msg.message, msg.channel),
+                          channel=msg.channel, roles=msg.roles)
+
+    def emote_segments(self, emote_info, message, channel=None):
+        """Memoized layout_emotes for a Twitch message, or None if it has no emotes.
+
+        Copypastas with the same emote layout share one segment tuple.
+        """
+        word_index = self.emote_providers.index(self.twitch_channel_ids.get(channel))
+        if not emote_info:
+            if not word_index:
+                return None
+            # A single split and dict lookup per word is cheaper than caching every plain message
+            segments = match_emote_words(message, word_index)
+        else:
+            key = (emote_info, message, channel)
+            segments = self.emote_layouts.get(key)
+            if segments is None:
+                segments = layout_emotes(message, emote_info, word_index)
+                self.emote_layouts[key] = segments
+        if not segments or (len(segments) == 1 and segments[0][1] is None):
+            return None
+        return segments
+
+    def publish_system(self, message):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.publish([ChatRecord('system', timestamp, None, None, message)])
+
+    def notify(self, event, platform, detail=None):
+        for callback in self.watchers:
+            try:
+                callback(event, platform, detail)
+            except Exception as e:
+                print(f"Error in chat watcher: {e}")
+
+    def apply_settings(self, settings):
+        self.twitch_token = settings.get('twitch_token')
+        self.youtube_api_key = settings.get('youtube_api_key')
+        self.twitch_recv_buffer = max(2048, int(settings.get('twitch_recv_buffer', TWITCH_RECV_BUFFER)))
+        self.set_rules(settings.get('rules', []))
+
+    def settings(self):
+        return {
+            'twitch_token': self.twitch_token,
+            'youtube_api_key': self.youtube_api_key,
+            'twitch_recv_buffer': self.twitch_recv_buffer,
+            'rules': self.rule_config
+        }
+
+    def set_rules(self, config):
+        """Compile and switch to a new list of filter rules; returns the errors of rules that were skipped.
+
+        Each rule is a dict with an action ('hide', 'highlight' or 'color' with a 'color'),
+        and any of 'keywords', 'regex', 'users', 'roles' and 'platforms' as conditions, all
+        of which must match. Keywords match whole words, ignoring case.
+        """
+        rules = RuleSet(config, self.rule_color_check)
+        # Swapping one reference is atomic, so publishing threads see either the old or new rules
+        self.rules = rules
+        self.rule_config = list(config)
+        return rules.errors
+
+    def load_badge_data(self):
+        """Load global and channel badge data from Twitch API"""
+        try:
+
+            response = self.http.get(GLOBAL_BADGES_URL)
+            if response.status_code == 200:
+                self.global_badges = response.json().get('badge_sets', {})
+                self.rebuild_badge_roles()
+        except Exception as e:
+            print(f"Error loading global badge data: {e}")
+
+    def load_channel_badge_data(self, channel_id):
+        """Load channel-specific badge data, once per room ID"""
+        if channel_id in self.channel_badges:
+            return
+        try:
+            url = CHANNEL_BADGES_URL.format(channel_id=channel_id)
+            response = self.http.get(url)
+            if response.status_code == 200:
+                self.channel_badges[channel_id] = response.json().get('badge_sets', {})
+                self.rebuild_badge_roles()
+        except Exception as e:
+            print(f"Error loading channel badge data: {e}")
+
+    def rebuild_badge_roles(self):
+        """Rebuild the badge-to-role table from the loaded badge sets; swapped in with one assignment"""
+        self.badge_roles = build_badge_roles(self.global_badges, *self.channel_badges.values())
+
+    def get_badge_url(self, badge_name, badge_version, room_id=None):
+        """Get the URL for a badge image"""
+
+        channel_badges = self.channel_badges.get(room_id, {})
+        if badge_name in channel_badges:
+            versions = channel_badges[badge_name].get('versions', {})
+            if badge_version in versions:
+                return versions[badge_version].get('image_url_1x')
+
+        if badge_name in self.global_badges:
+            versions = self.global_badges[badge_name].get('versions', {})
+            if badge_version in versions:
+                return versions[badge_version].get('image_url_1x')
+
+        return None
+
+    def get_twitch_channel_id(self, channel_name):
+        """Get Twitch channel ID from login name"""
+        return self.get_twitch_channel_ids([channel_name]).get(channel_name)
+
+    def get_twitch_channel_ids(self, channel_names):
+        """Get Twitch channel IDs for up to 100 login names in one Helix request"""
+        ids = {}
+        try:
+            headers = {
+                'Authorization': f'Bearer {self.twitch_token}'
+            }
+            params = [('login', name) for name in channel_names[:100]]
+            response = self.http.get(f"{TWITCH_API_BASE}/users", headers=headers, params=params)
+            if response.status_code == 200:
+                for user in response.json().get('data', []):
+                    ids[user['login']] = user['id']
+        except Exception as e:
+            print(f"Error getting channel ID: {e}")
+        return ids
+
+    def parse_twitch_channels(self, value):
+        """Split a comma or space separated channel list into unique lowercase names"""
+        channels = []
+        for name in value.replace(',', ' ').split():
+            name = name.lstrip('#').lower()
+            if name and name not in channels:
+                channels.append(name)
+        return channels
+
+    def start_twitch(self, channels):
+        """Read chat from channels, replacing any running Twitch session"""
+        self.twitch_channels = list(channels)
+        self.start_service('twitch', self.twitch_session)
+
+    def youtube_video_from_input(self, youtube_input):
+        """The video ID in a URL or bare 11-character ID, or None if the input names a channel"""
+        video_id = self.extract_video_id_from_url(youtube_input)
+        if not video_id and len(youtube_input) == 11 and not youtube_input.startswith('@'):
+            video_id = youtube_input
+        return video_id
+
+    def start_youtube(self, youtube_input, video_id=None):
+        """Read chat from a video, or from a channel's live stream, replacing any running YouTube session"""
+        self.youtube_video_id = video_id
+        self.start_service('youtube', self.youtube_session, youtube_input, video_id)
+
+    def start_service(self, platform, session, *args):
+        """Start a platform session on the engine loop, replacing any previous one"""
+        self.stop_service(platform)
+        self.service_sessions[platform] += 1
+        self.connected_services[platform] = True
+        self.service_tasks[platform] = self.engine.submit(session(self.service_sessions[platform], *args))
+
+    def stop_service(self, platform):
+        task = self.service_tasks[platform]
+        if task:
+            task.cancel()
+            self.service_tasks[platform] = None
+        self.connected_services[platform] = False
+
+    def end_session(self, platform, session_id):
+        """Stop a session that ended on its own; returns False if it was already replaced or stopped"""
+        if self.service_sessions[platform] != session_id or not self.connected_services[platform]:
+            return False
+        self.stop_service(platform)
+        return True
+
+    def start_recording(self, path):
+        """Append every raw Twitch line and YouTube item received from now on to path"""
+        self.stop_recording()
+        self.recorder = ChatRecorder(path)
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+
+    def start_replay(self, path, speed=1.0):
+        """Play a recording through the normal parsing path; speed 0 replays as fast as possible"""
+        self.start_service('replay', self.replay_session, path, speed)
+
+    def open_history(self, path=None):
+        """Save every chat message from now on to a searchable history database"""
+        self.close_history()
+        self.history = ChatHistory(path or get_history_path(), metrics=self.metrics)
+        self.unsubscribe_history = self.subscribe(self.history.add)
+
+    def close_history(self):
+        history, self.history = self.history, None
+        if history:
+            self.unsubscribe_history()
+            history.close()
+
+    def start_metrics_export(self, path, interval=METRICS_EXPORT_INTERVAL):
+        """Rewrite path with a metrics snapshot every interval seconds"""
+        self.stop_metrics_export()
+        self.metrics_task = self.engine.submit(self.export_metrics(path, interval))
+
+    def stop_metrics_export(self):
+        if self.metrics_task:
+            self.metrics_task.cancel()
+            self.metrics_task = None
+
+    async def export_metrics(self, path, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(write_metrics, path, self.metrics.snapshot())
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+
+    def close(self):
+        for platform in self.service_tasks:
+            self.stop_service(platform)
+        self.stop_metrics_export()
+        self.stop_recording()
+        self.close_history()
+        self.engine.stop()
+        self.http.close()
+
+    async def supervise(self, platform, session_id, connect_once, *args):
+        """Run connect_once repeatedly, reconnecting with jittered backoff after a drop"""
+        label = 'Twitch' if platform == 'twitch' else 'YouTube'
+        state = ConnectionState()
+        self.connection_states[platform] = state
+        try:
+            while True:
+                immediate = False
+                try:
+                    reason, immediate = await connect_once(state, *args)
+                except asyncio.CancelledError:
+                    raise
+                except SessionFinished:
+                    raise
+                except Exception as e:
+                    if not state.ever_connected:
+                        # A first attempt that fails is a bad channel, token or video, not a network blip
+                        raise SessionFinished(f"{label} connection error: {e}")
+                    reason = str(e) or type(e).__name__
+
+                state.disconnected()
+                delay = 0 if immediate else state.next_delay()
+                self.publish_system(f"{label} connection lost ({reason}), reconnecting in {delay:.0f}s...")
+                await asyncio.sleep(delay)
+
+        except SessionFinished as e:
+            if str(e):
+                self.publish_system(str(e))
+            self.notify('ended', platform, session_id)
+
+    def report_reconnected(self, label, state):
+        outage = state.connected()
+        if outage:
+            gap, missed = outage
+            self.publish_system(
+                f"{label} reconnected after {gap:.1f}s; about {missed} messages may have been missed")
+
+    async def replay_session(self, session_id, path, speed):
+        """Publish a recording's messages with their original spacing divided by speed"""
+        entries = read_recording(path)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = None
+        count = 0
+        try:
+            while True:
+                # Reading and decompressing happen off the loop, a chunk at a time
+                chunk = await asyncio.to_thread(list, itertools.islice(entries, REPLAY_CHUNK))
+                if not chunk:
+                    break
+                batch = []
+                parse_time = 0.0
+                for timestamp, source, payload in chunk:
+                    if speed > 0:
+                        if first is None:
+                            first = timestamp
+                        delay = started + (timestamp - first) / speed - loop.time()
+                        if delay > 0:
+                            if batch:
+                                self.publish(batch)
+                                batch = []
+                            await asyncio.sleep(delay)
+                    parse_started = time.perf_counter()
+                    record = self.replay_record(source, payload)
+                    parse_time += time.perf_counter() - parse_started
+                    if record:
+                        batch.append(record)
+                        count += 1
+                self.metrics.observe('parse', parse_time, len(chunk))
+                if batch:
+                    self.publish(batch)
+            self.publish_system(f"Replay finished: {count} messages in {loop.time() - started:.1f}s")
+        except Exception as e:
+            self.publish_system(f"Replay error: {e}")
+        finally:
+            entries.close()
+        self.notify('ended', 'replay', session_id)
+
+    def replay_record(self, source, payload):
+        """The ChatRecord for one recorded entry, or None if it is not a chat message"""
+        if source == 'twitch':
+            msg = self.parse_twitch_message(payload)
+            return self.twitch_record(msg) if msg else None
+        if source == 'youtube':
+            return self.youtube_record(youtube_item_from_json(payload), datetime.now().strftime("%H:%M:%S"))
+        return None
+
+    async def twitch_session(self, session_id):
+        """Own the Twitch connection for one session; runs on the engine loop until cancelled"""
+        await self.supervise('twitch', session_id, self.run_twitch_connection, list(self.twitch_channels))
+
+    async def run_twitch_connection(self, state, channels):
+        """Connect once and read until the connection drops; returns (reason, reconnect immediately)"""
+        writer = None
+        join_task = None
+        try:
+            # Channel IDs and badge data are cached, so reconnects skip these requests
+            missing = [name for name in channels if name not in self.twitch_channel_ids]
+            if missing:
+                self.twitch_channel_ids.update(await asyncio.to_thread(self.get_twitch_channel_ids, missing))
+            if not self.global_badges:
+                await asyncio.to_thread(self.load_badge_data)
+            for name in channels:
+                if name in self.twitch_channel_ids:
+                    await asyncio.to_thread(self.load_channel_badge_data, self.twitch_channel_ids[name])
+            emote_sets_changed = await asyncio.to_thread(self.emote_providers.load_global)
+            for name in channels:
+                if name in self.twitch_channel_ids:
+                    emote_sets_changed |= await asyncio.to_thread(
+                        self.emote_providers.load_channel, self.twitch_channel_ids[name])
+            if emote_sets_changed:
+                # Layouts built before the third-party index changed may have missed its emotes
+                self.emote_layouts.items.clear()
+                self.notify('emotes', 'twitch')
+
+            context = ssl.create_default_context()
+            reader, writer = await asyncio.open_connection(
+                TWITCH_SERVER, TWITCH_PORT, ssl=context, server_hostname=TWITCH_SERVER)
+            self.twitch_writer = writer
+
+            commands = [
+                "NICK justinfan12345",
+                "CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership"
+            ]
+            if self.twitch_token:
+                commands.insert(0, f"PASS {self.twitch_token}")
+            writer.write("".join(f"{cmd}\r\n" for cmd in commands).encode('utf-8'))
+            await writer.drain()
+            join_task = asyncio.create_task(self.join_twitch_channels(writer, channels))
+            self.report_reconnected('Twitch', state)
+
+            metrics = self.metrics
+            async for line in aiter_irc_lines(reader, self.twitch_recv_buffer, metrics):
+                if self.recorder:
+                    self.recorder.record('twitch', line)
+                if line.startswith('PING'):
+                    writer.write(f"PONG{line[4:]}\r\n".encode('utf-8'))
+                    continue
+
+                started = time.perf_counter()
+                msg = self.parse_twitch_message(line)
+                if msg:
+                    record = self.twitch_record(msg)
+                    metrics.observe('parse', time.perf_counter() - started)
+                    state.messages += 1
+                    self.publish([record])
+                elif line.endswith(' RECONNECT'):
+                    return "server requested a reconnect", True
+                elif ' NOTICE ' in line and any(failure in line for failure in TWITCH_AUTH_FAILURES):
+                    raise SessionFinished(f"Twitch login failed: {line.rsplit(' :', 1)[-1]}")
+
+            return "connection closed", False
+
+        finally:
+            if join_task:
+                join_task.cancel()
+            if writer:
+                writer.close()
+            if self.twitch_writer is writer:
+                self.twitch_writer = None
+
+    async def join_twitch_channels(self, writer, channels):
+        """JOIN channels in batches that stay inside Twitch's JOIN rate limit"""
+        for i in range(0, len(channels), TWITCH_JOIN_LIMIT):
+            if i:
+                await asyncio.sleep(TWITCH_JOIN_WINDOW)
+            batch = channels[i:i + TWITCH_JOIN_LIMIT]
+            writer.write(f"JOIN {','.join('#' + name for name in batch)}\r\n".encode('utf-8'))
+            await writer.drain()
+            noun = "channels" if len(batch) > 1 else "channel"
+            self.publish_system(f"Connected to Twitch {noun} {', '.join('#' + name for name in batch)}")
+
+    async def youtube_session(self, session_id, youtube_input, video_id):
+        """Own the YouTube chat poller for one session; runs on the engine loop until cancelled"""
+        if not video_id:
+            self.publish_system("Searching for live stream...")
+            video_id = await asyncio.to_thread(self.get_live_video_from_channel, youtube_input)
+            if not video_id:
+                self.publish_system("No live stream found. Please try a video ID or URL.")
+                self.notify('ended', 'youtube', session_id)
+                return
+            self.youtube_video_id = video_id
+            self.notify('status', 'youtube')
+
+        # The resolved video ID is reused on reconnect, so the live search is not repeated
+        await self.supervise('youtube', session_id, self.run_youtube_connection, video_id)
+
+    async def run_youtube_connection(self, state, video_id):
+        """Poll one pytchat instance until it stops; returns (reason, reconnect immediately)"""
+        chat = None
+        try:
+            # pytchat is only needed once YouTube connects; importing it takes a while, so not on the loop
+            pytchat = await asyncio.to_thread(import_timed, 'pytchat', self.metrics)
+            # pytchat only installs its signal handler when interruptable, which fails off the main thread
+            chat = await asyncio.to_thread(pytchat.create, video_id=video_id, interruptable=False)
+            self.youtube_chat = chat
+            if not state.ever_connected:
+                self.publish_system(f"Connected to YouTube video {video_id}")
+            self.report_reconnected('YouTube', state)
+
+            loop = asyncio.get_running_loop()
+            while chat.is_alive():
+                started = loop.time()
+                count, interval = await asyncio.to_thread(self.pull_youtube_items, chat)
+                state.messages += count
+                # Wait as long as YouTube asks between polls rather than refetching straight away
+                interval = min(max(interval, YOUTUBE_MIN_POLL_INTERVAL), YOUTUBE_MAX_POLL_INTERVAL)
+                await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+
+            try:
+                chat.raise_for_status()
+            except pytchat.ChatDataFinished:
+                raise SessionFinished("YouTube stream has ended")
+            return "chat stopped", False
+
+        finally:
+            if chat:
+                chat.terminate()
+            if self.youtube_chat is chat:
+                self.youtube_chat = None
+
+    def pull_youtube_items(self, chat):
+        """Fetch one poll of YouTube chat and queue it as a single batch; runs in a worker thread.
+
+        Returns (items queued, seconds YouTube suggests waiting before the next poll).
+        """
+        started = time.perf_counter()
+        data = chat.get()
+        self.metrics.observe('youtube_poll', time.perf_counter() - started)
+        items = getattr(data, 'items', None)
+        if not items:
+            return 0, getattr(data, 'interval', 0)
+        if self.recorder:
+            for item in items:
+                self.recorder.record('youtube', item.json())
+        started = time.perf_counter()
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        records = [self.youtube_record(item, timestamp) for item in items]
+        self.metrics.observe('parse', time.perf_counter() - started, len(records))
+        self.publish(records)
+        return len(items), data.interval
+
+    def youtube_record(self, item, timestamp):
+        """Map a pytchat item onto the donation, highlight and role styling used for Twitch"""
+        author = item.author
+        roles = 0
+        if author.isChatOwner:
+            roles |= ROLE_BROADCASTER
+        if author.isChatModerator:
+            roles |= ROLE_MODERATOR
+        if author.isChatSponsor:
+            roles |= ROLE_SUBSCRIBER
+
+        message = item.message
+        segments = None
+        if any(not isinstance(part, str) for part in item.messageEx):
+            segments = []
+            parts = []
+            for part in item.messageEx:
+                if isinstance(part, str):
+                    segments.append((part, None))
+                    parts.append(part)
+                elif not part['id'].isascii():
+                    # Standard emoji come through as their shortcut; the ID is the emoji itself
+                    segments.append((part['id'], None))
+                    parts.append(part['id'])
+                else:
+                    emote_id = f"yt:{part['id']}"
+                    self.youtube_emoji_urls[emote_id] = part['url']
+                    segments.append((part['txt'], emote_id))
+                    parts.append(part['txt'])
+            message = ''.join(parts)
+
+        is_donation = item.type in YOUTUBE_PAID_TYPES
+        is_highlight = item.type == 'newSponsor'
+        if is_donation:
+            prefix = f"{YOUTUBE_PAID_TYPES[item.type]} {item.amountString}: " if item.amountString else ''
+            message = prefix + message
+            if prefix and segments is not None:
+                segments.insert(0, (prefix, None))
+
+        return ChatRecord('chat', timestamp, 'youtube', author.name, message, is_donation=is_donation,
+                          is_highlight=is_highlight, emotes=tuple(segments) if segments else None, roles=roles)
+
+    def parse_twitch_message(self, irc_message):
+        """Parse a raw IRC line into a TwitchMessage with its role bitmask, or None if it is not a chat message"""
+        msg = parse_twitch_line(irc_message)
+        if msg:
+            msg.roles = roles_from_badges(msg.tag('badges'), self.badge_roles)
+        return msg
+
+    def get_live_video_from_channel(self, channel_input):
+        """Resolve a channel, handle or name to its live video ID; runs in a worker thread"""
+        if not self.youtube_api_key:
+            return None
+
+        try:
+            channel_id = self.youtube_resolver.resolve_channel(channel_input, self.youtube_api_key)
+            if channel_id:
+                return self.youtube_resolver.live_video(channel_id, self.youtube_api_key)
+        except Exception as e:
+            self.publish_system(f"YouTube API error: {e}")
+        finally:
+            self.notify('status', 'youtube')
+
+        return None
+
+    def extract_video_id_from_url(self, url):
+        if 'youtube.com/watch' in url:
+            parsed = urlparse(url)
+            return parse_qs(parsed.query).get('v', [None])[0]
+        elif 'youtu.be/' in url:
+            return url.split('youtu.be/')[-1].split('?')[0]
+        return None
+
+def format_record(record):
+    """One line of plain text for a record"""
+    if record.kind == 'system':
+        return f"[{record.timestamp}] * {record.message}"
+    source = f"{record.platform} #{record.channel}" if record.channel else record.platform
+    return f"[{record.timestamp}] {source} {record.username}: {record.message}"
+
+def main(argv=None):
+    """Headless entry point: print or forward chat without tkinter"""
+    parser = argparse.ArgumentParser(description="Read Twitch and YouTube chat without a window")
+    parser.add_argument('--twitch', help="comma or space separated Twitch channels")
+    parser.add_argument('--youtube', help="YouTube channel, @handle, video ID or URL")
+    parser.add_argument('--json', action='store_true', help="print one JSON object per line")
+    parser.add_argument('--forward', metavar='HOST:PORT', help="also send JSON lines to a TCP listener")
+    parser.add_argument('--quiet', action='store_true', help="do not print messages, only the final rate")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--record', metavar='FILE', help="append raw chat to a compressed recording")
+    parser.add_argument('--replay', metavar='FILE', help="play back a recording instead of connecting")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed multiplier, 0 for as fast as possible")
+    parser.add_argument('--history', action='store_true', help="also save messages to the searchable history database")
+    parser.add_argument('--metrics', metavar='FILE', help="write a metrics snapshot periodically, Prometheus text for .prom")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_EXPORT_INTERVAL, metavar='SECONDS')
+    args = parser.parse_args(argv)
+    if not args.twitch and not args.youtube and not args.replay:
+        parser.error("give --twitch, --youtube or --replay")
+
+    chat = ChatEngine(os.getenv('CHAT_EMOTE_FIXTURES'))
+    try:
+        chat.apply_settings(read_settings())
+    except Exception as e:
+        print(f"Error loading settings: {e}", file=sys.stderr)
+    chat.twitch_token = os.getenv('TWITCH_TOKEN', chat.twitch_token)
+    chat.youtube_api_key = os.getenv('YOUTUBE_API_KEY', chat.youtube_api_key)
+
+    forward = None
+    if args.forward:
+        host, _, port = args.forward.rpartition(':')
+        forward = socket.create_connection((host or 'localhost', int(port)))
+
+    lock = threading.Lock()
+    done = threading.Event()
+    counts = {'chat': 0, 'system': 0}
+
+    def on_records(records):
+        with lock:
+            for record in records:
+                if record.hidden:
+                    continue
+                counts[record.kind] += 1
+                data = None
+                if args.json or forward:
+                    data = json.dumps(record.as_dict(), ensure_ascii=False)
+                if forward:
+                    forward.sendall((data + '\n').encode('utf-8'))
+                if not args.quiet:
+                    print(data if args.json else format_record(record), flush=True)
+
+    def on_event(event, platform, detail):
+        if event == 'ended' and chat.end_session(platform, detail) and not any(chat.connected_services.values()):
+            done.set()
+
+    chat.subscribe(on_records)
+    chat.watch(on_event)
+
+    if args.record:
+        chat.start_recording(args.record)
+    if args.history:
+        chat.open_history()
+    if args.metrics:
+        chat.start_metrics_export(args.metrics, args.metrics_interval)
+    if args.replay:
+        chat.start_replay(args.replay, args.speed)
+
+    if args.twitch:
+        chat.start_twitch(chat.parse_twitch_channels(args.twitch))
+    if args.youtube:
+        youtube_input = args.youtube.strip()
+        video_id = chat.youtube_video_from_input(youtube_input)
+        if not video_id and not chat.youtube_api_key:
+            parser.error("a YouTube channel needs an API key in the settings file or YOUTUBE_API_KEY")
+        chat.start_youtube(youtube_input, video_id)
+
+    started = time.perf_counter()
+    try:
+        done.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.perf_counter() - started
+        chat.close()
+        if args.metrics:
+            write_metrics(args.metrics, chat.metrics.snapshot())
+        if forward:
+            forward.close()
+        print(f"{counts['chat']} messages in {elapsed:.1f}s ({counts['chat'] / max(elapsed, 1e-9):.1f}/s)",
+              file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
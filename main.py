@@ -1,52 +1,347 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, simpledialog, ttk
-import socket
-import ssl
+import tkinter.font as tkfont
 import threading
-import re
 from datetime import datetime
 import json
 import os
-import webbrowser
-import pytchat
-import requests
-from urllib.parse import urlparse, parse_qs
-from PIL import Image, ImageTk
+import sys
 import io
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from chat_engine import (
+    ChatEngine, ChatRecord, LRUCache, METRICS_EXPORT_INTERVAL, PRIORITY_BROADCASTER, PRIORITY_SYSTEM,
+    ROLE_ICONS, ROLE_STYLES, SETTINGS_FILE, get_cache_dir, read_settings
+)
+
+# PIL, pytchat, requests and webbrowser are imported on first use, so they stay out of startup
+IMPORT_TIME_MS = (time.perf_counter() - IMPORT_STARTED) * 1000
 
-TWITCH_SERVER = 'irc.chat.twitch.tv'
-TWITCH_PORT = 6697
 TOKEN_HELP_URL = "https://twitchtokengenerator.com"
-YOUTUBE_API_BASE = "https://www.googleapis.com/youtube/v3"
-TWITCH_API_BASE = "https://api.twitch.tv/helix"
 
 BADGE_BASE_URL = "https://static-cdn.jtvnw.net/badges/v1/"
-GLOBAL_BADGES_URL = "https://badges.twitch.tv/v1/badges/global/display"
-CHANNEL_BADGES_URL = "https://badges.twitch.tv/v1/badges/channels/{channel_id}/display"
 EMOTE_BASE_URL = "https://static-cdn.jtvnw.net/emoticons/v2/"
+BADGE_ICON_URLS = {
+    "prime": "https://static-cdn.jtvnw.net/badges/v1/bbbe0db0-a598-423e-86d0-f9fb98ca1933/3",
+    "broadcaster": "https://static-cdn.jtvnw.net/badges/v1/5527c58c-fb7d-422d-b71b-f309dcb85cc1/3",
+    "moderator": "https://static-cdn.jtvnw.net/badges/v1/3267646d-33f0-4b17-b3df-f923a41db1d0/3",
+    "vip": "https://static-cdn.jtvnw.net/badges/v1/b817aba4-fad8-49e2-b88a-7cc744dfa6ec/3",
+    "subscriber": "https://static-cdn.jtvnw.net/badges/v1/5d9f2208-5dd8-11e7-8513-2ff4adfae661/3",
+    "subtember": "https://static-cdn.jtvnw.net/badges/v1/4149750c-9582-4515-9e22-da7d5437643b/3"
+}
+
+RENDER_FRAME_MS = 33
+MAX_MESSAGES_PER_FRAME = 150
+MAX_SCROLLBACK_LINES = 5000
+MAX_SCROLLBACK_BYTES = 2 * 1024 * 1024
+SCROLLBACK_TRIM_CHUNK = 250
+VIRTUAL_HISTORY_SIZE = 200000
+VIRTUAL_MARGIN_ROWS = 10
+SHED_MAX_LATENCY_MS = 2000
+REPEAT_WINDOW = 10.0
+REPEAT_MAX_DISTANCE = 50
+RATE_WINDOW = 1.0
+# Load shedding drops the lowest priorities first and never drops bits, highlights or system lines
+MAX_SHED_PRIORITY = PRIORITY_BROADCASTER
+
+IMAGE_WORKERS = 4
+IMAGE_MEMORY_CACHE_SIZE = 1000
+IMAGE_DISK_CACHE_BYTES = 64 * 1024 * 1024
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600
+IMAGE_FETCH_TIMEOUT = 5
+IMAGE_FAILURE_TTL = 300
+HISTORY_RANGES = (
+    ("Any time", None),
+    ("Last 15 minutes", 15 * 60),
+    ("Last hour", 3600),
+    ("Last 6 hours", 6 * 3600),
+    ("Last 24 hours", 24 * 3600)
+)
+SETTINGS_POLL_MS = 2000
+HISTORY_PLATFORMS = (("All platforms", None), ("Twitch", 'twitch'), ("YouTube", 'youtube'))
+
+def photo_image(data):
+    """A Tk image from PNG bytes"""
+    from PIL import Image, ImageTk
+    return ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+
+def open_token_help():
+    import webbrowser
+    webbrowser.open(TOKEN_HELP_URL)
+
+class DiskImageCache:
+    """Resized PNG bytes stored on disk with an LRU size budget and ETag revalidation"""
+
+    def __init__(self, directory, http, max_bytes=IMAGE_DISK_CACHE_BYTES, max_age=IMAGE_CACHE_MAX_AGE, metrics=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.http = http
+        self.metrics = metrics
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
+        self.index = {}
+        self.total_bytes = 0
+        self.dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_hits = 0
+        self.load_index()
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            for key, entry in index.items():
+                if os.path.exists(os.path.join(self.directory, entry['file'])):
+                    self.index[key] = entry
+                    self.total_bytes += entry['size']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading image cache index: {e}")
+        self.remove_unindexed()
 
-def get_config_path():
-    appdata = os.getenv('APPDATA')
-    if appdata:
-        config_dir = os.path.join(appdata, 'Chat')
-        os.makedirs(config_dir, exist_ok=True)
-        return os.path.join(config_dir, 'config.json')
-    return 'chat_settings.json'
+    def remove_unindexed(self):
+        """Delete image files the index does not list, such as those written after its last save before a crash"""
+        indexed = {entry['file'] for entry in self.index.values()}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.png') and name not in indexed:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
 
-SETTINGS_FILE = get_config_path()
+    def save_index(self):
+        with self.lock:
+            index = dict(self.index)
+            self.dirty = 0
+        try:
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            print(f"Error saving image cache index: {e}")
+
+    def read(self, key):
+        """Return (bytes, entry) for key, or (None, None) if it is not on disk"""
+        with self.lock:
+            entry = self.index.get(key)
+        if not entry:
+            return None, None
+        try:
+            with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+                return f.read(), entry
+        except OSError:
+            with self.lock:
+                if self.index.pop(key, None):
+                    self.total_bytes -= entry['size']
+            return None, None
+
+    def write(self, key, data, etag=None):
+        file_name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.png'
+        try:
+            with open(os.path.join(self.directory, file_name), 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Error writing image cache: {e}")
+            return
+        now = time.time()
+        with self.lock:
+            old = self.index.get(key)
+            if old:
+                self.total_bytes -= old['size']
+            self.index[key] = {'file': file_name, 'size': len(data), 'etag': etag, 'fetched': now, 'used': now}
+            self.total_bytes += len(data)
+            self.dirty += 1
+            self.evict()
+            flush = self.dirty >= 50
+        if flush:
+            self.save_index()
+
+    def touch(self, key, revalidated=False):
+        with self.lock:
+            entry = self.index.get(key)
+            if entry:
+                entry['used'] = time.time()
+                if revalidated:
+                    entry['fetched'] = entry['used']
+                    self.dirty += 1
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its budget; caller holds the lock"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]['used']):
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError:
+                pass
+            del self.index[key]
+            self.total_bytes -= entry['size']
+
+    def fetch(self, key, url, size):
+        """Return resized PNG bytes for url, from disk when fresh and from the network otherwise"""
+        data, entry = self.read(key)
+        if data is not None and time.time() - entry['fetched'] < self.max_age:
+            self.hits += 1
+            self.touch(key)
+            return data
+
+        headers = {}
+        if data is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+
+        started = time.perf_counter()
+        try:
+            response = self.http.get(url, headers=headers, timeout=IMAGE_FETCH_TIMEOUT)
+        except Exception:
+            if data is not None:
+                # Offline: a stale image is better than none
+                self.stale_hits += 1
+                return data
+            raise
+
+        if response.status_code == 304 and data is not None:
+            self.revalidated += 1
+            self.touch(key, revalidated=True)
+            return data
+        if response.status_code != 200:
+            return data
+
+        self.misses += 1
+        from PIL import Image
+        img = Image.open(io.BytesIO(response.content))
+        img = img.resize(size, Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format='PNG')
+        data = out.getvalue()
+        self.write(key, data, response.headers.get('ETag'))
+        if self.metrics:
+            self.metrics.observe('image_fetch', time.perf_counter() - started)
+        return data
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses + self.revalidated
+        return (self.hits + self.revalidated) / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'stale_hits': self.stale_hits,
+            'entries': len(self.index),
+            'bytes': self.total_bytes
+        }
+
+def one_line(text):
+    """text with line breaks flattened, since the window counts every record as exactly one Tk line"""
+    return text.replace('\n', ' ')
+
+class DisplayLine:
+    """A record as shown in chat_display, with the renderer's line number and repeat counter"""
+
+    __slots__ = ('record', 'seq', 'repeat', 'shown_repeat')
+
+    def __init__(self, record, seq):
+        self.record = record
+        self.seq = seq
+        self.repeat = 1
+        self.shown_repeat = 1
+
+class RepeatIndex:
+    """Rolling time window of recent message content, used to collapse repeated lines"""
+
+    def __init__(self, window=REPEAT_WINDOW):
+        self.window = window
+        self.entries = {}
+        self.order = deque()
+
+    @staticmethod
+    def key(message):
+        """Hash of the message with case, spacing and back-to-back repeated words folded away"""
+        words = []
+        for word in message.casefold().split():
+            if not words or words[-1] != word:
+                words.append(word)
+        return hash(' '.join(words))
+
+    def expire(self, now):
+        cutoff = now - self.window
+        order = self.order
+        while order and order[0][0] < cutoff:
+            _, key, record = order.popleft()
+            if self.entries.get(key) is record:
+                del self.entries[key]
+
+    def get(self, key, now):
+        self.expire(now)
+        return self.entries.get(key)
+
+    def add(self, key, record, now):
+        self.entries[key] = record
+        self.order.append((now, key, record))
+
+    def clear(self):
+        self.entries.clear()
+        self.order.clear()
+
+class RingBuffer:
+    """Fixed-capacity list that overwrites its oldest item, with O(1) append and indexing"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.start = 0
+        self.count = 0
+        self.total = 0
+
+    def append(self, item):
+        end = (self.start + self.count) % self.capacity
+        self.items[end] = item
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.total += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.items[(self.start + index) % self.capacity]
+
+    @property
+    def first_seq(self):
+        """Sequence number of the oldest item still held"""
+        return self.total - self.count
 
 class MultiPlatformChat:
-    def __init__(self):
-        self.root = tk.Tk()
-        self.icon_images = {
-            "prime": ImageTk.PhotoImage(Image.open(io.BytesIO(requests.get("https://static-cdn.jtvnw.net/badges/v1/bbbe0db0-a598-423e-86d0-f9fb98ca1933/3").content)).resize((16, 16))),
-            "broadcaster": ImageTk.PhotoImage(Image.open(io.BytesIO(requests.get("https://static-cdn.jtvnw.net/badges/v1/5527c58c-fb7d-422d-b71b-f309dcb85cc1/3").content)).resize((16, 16))),
-            "moderator": ImageTk.PhotoImage(Image.open(io.BytesIO(requests.get("https://static-cdn.jtvnw.net/badges/v1/3267646d-33f0-4b17-b3df-f923a41db1d0/3").content)).resize((16, 16))),
-            "vip": ImageTk.PhotoImage(Image.open(io.BytesIO(requests.get("https://static-cdn.jtvnw.net/badges/v1/b817aba4-fad8-49e2-b88a-7cc744dfa6ec/3").content)).resize((16, 16))),
-            "subscriber": ImageTk.PhotoImage(Image.open(io.BytesIO(requests.get("https://static-cdn.jtvnw.net/badges/v1/5d9f2208-5dd8-11e7-8513-2ff4adfae661/3").content)).resize((16, 16))),
-            "subtember": ImageTk.PhotoImage(Image.open(io.BytesIO(requests.get("https://static-cdn.jtvnw.net/badges/v1/4149750c-9582-4515-9e22-da7d5437643b/3").content)).resize((16, 16)))
-        }
+    def __init__(self, profile_startup=False):
+        self.profile_startup = profile_startup
+        self.startup_started = time.perf_counter()
+        self.startup_timings = {'imports': IMPORT_TIME_MS}
+        self.startup_mark = self.startup_started
 
+        self.root = tk.Tk()
+        self.icon_images = {}
+        self.record_startup_timing('tk')
 
         self.root.title("Chat")
         self.root.geometry("500x700")
@@ -54,26 +349,147 @@ class MultiPlatformChat:
 
         self.overlay_mode = False
         self.transparency = 0.9
-        self.twitch_channel_id = None
 
-        self.badge_cache = {}
-        self.emote_cache = {}
-        self.global_badges = {}
-        self.channel_badges = {}
+        # Connections, parsing and badge/emote data live in the engine; this window is one of its subscribers
+        self.chat = ChatEngine(os.getenv('CHAT_EMOTE_FIXTURES'))
+        self.chat.rule_color_check = self.is_known_color
+        self.record_startup_timing('engine')
+
+        self.badge_cache = LRUCache(IMAGE_MEMORY_CACHE_SIZE)
+        self.emote_cache = LRUCache(IMAGE_MEMORY_CACHE_SIZE)
+        # Tk drops an image once Python holds no reference, so anything still shown in chat_display
+        # is kept here by image name with a use count, whatever the LRU caches have evicted
+        self.embedded_images = {}
+        self.image_cache = DiskImageCache(os.path.join(get_cache_dir(), 'images'), self.chat.http,
+                                          metrics=self.chat.metrics)
+        self.emote_inflight = set()
+        # Emote ID -> monotonic time until which a failed fetch is not retried
+        self.emote_failed = {}
+        self.image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+        self.record_startup_timing('caches')
+
+        self.render_queue = deque()
+        self.render_frame_ms = RENDER_FRAME_MS
+        self.max_messages_per_frame = MAX_MESSAGES_PER_FRAME
+        self.render_queue_depth = 0
+
+        self.shed_enabled = True
+        self.shed_max_latency_ms = SHED_MAX_LATENCY_MS
+        self.shed_total = 0
+        self.ingest_count = 0
+        self.render_count = 0
+        self.ingest_rate = 0.0
+        self.render_rate = MAX_MESSAGES_PER_FRAME * 1000 / RENDER_FRAME_MS
+        self.rate_window_start = time.monotonic()
+        self.render_saturated = False
+
+        self.max_scrollback_lines = MAX_SCROLLBACK_LINES
+        self.max_scrollback_bytes = MAX_SCROLLBACK_BYTES
+        self.scrollback_sizes = deque()
+        self.scrollback_bytes = 0
+        self.display_seq = 0
+        self.lines_trimmed = 0
+
+        self.repeat_index = RepeatIndex()
+        self.collapsed_total = 0
+
+        self.display_mode = 'text'
+        self.virtual_history_size = VIRTUAL_HISTORY_SIZE
+        self.chat_model = None
+        self.virtual_top = None
+        self.virtual_line_height = 1
+
+        self.show_stats = False
+        self.stats_totals = {}
+
+        self.rule_color_tags = set()
+        self.settings_mtime = None
+
+        self.history_enabled = True
+        self.search_window = None
+        self.search_generation = 0
+        self.search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+        self.chat.metrics.add_collector(self.collect_metrics)
 
         self.create_ui()
+        self.record_startup_timing('ui')
 
-        self.twitch_sock = None
-        self.youtube_chat = None
-        self.connected_services = {'twitch': False, 'youtube': False}
-        self.chat_threads = []
-
-        self.twitch_token = None
-        self.twitch_channel = None
-        self.youtube_video_id = None
-        self.youtube_api_key = None
+        self.chat.subscribe(self.queue_records)
+        self.chat.watch(self.on_engine_event)
 
         self.load_settings()
+        self.record_startup_timing('settings')
+
+        if self.history_enabled:
+            try:
+                self.chat.open_history()
+            except Exception as e:
+                self.add_system_message(f"Error opening chat history: {e}")
+        self.root.bind('<Control-f>', lambda e: self.open_search())
+
+        # Raw chat recording and replay, for reproducing load in benchmarks
+        if os.getenv('CHAT_RECORD'):
+            self.chat.start_recording(os.getenv('CHAT_RECORD'))
+        if os.getenv('CHAT_REPLAY'):
+            self.chat.start_replay(os.getenv('CHAT_REPLAY'), float(os.getenv('CHAT_REPLAY_SPEED', '1')))
+        if os.getenv('CHAT_METRICS_FILE'):
+            self.chat.start_metrics_export(os.getenv('CHAT_METRICS_FILE'),
+                                           float(os.getenv('CHAT_METRICS_INTERVAL', METRICS_EXPORT_INTERVAL)))
+
+        self.pending_badge_icons = set(BADGE_ICON_URLS)
+        self.load_badge_icons()
+        self.root.after(self.render_frame_ms, self.render_frame)
+        self.root.after(SETTINGS_POLL_MS, self.check_settings_file)
+        self.root.after_idle(self.on_window_shown)
+
+    def record_startup_timing(self, phase):
+        """Record the time spent since the previous startup phase"""
+        now = time.perf_counter()
+        self.startup_timings[phase] = (now - self.startup_mark) * 1000
+        self.startup_mark = now
+
+    def on_window_shown(self):
+        self.startup_timings['window_shown'] = (time.perf_counter() - self.startup_started) * 1000
+        self.log_startup_timings()
+
+    def log_startup_timings(self):
+        """Report the startup breakdown once the window is up and all badge icons have settled"""
+        if not self.profile_startup or self.pending_badge_icons or 'window_shown' not in self.startup_timings:
+            return
+        timings = dict(self.startup_timings)
+        timings['total'] = timings['imports'] + timings['window_shown']
+        report = "Startup: " + " | ".join(f"{phase} {ms:.1f} ms" for phase, ms in timings.items())
+
+        # A --windowed build has no console, so the report also goes to the chat and to a log kept across runs
+        if sys.stdout:
+            print(report)
+        self.add_system_message(report)
+        try:
+            with open(os.path.join(get_cache_dir(), 'startup.log'), 'a') as f:
+                f.write(json.dumps({'time': time.time(), 'frozen': bool(getattr(sys, 'frozen', False)), **timings}) + '\n')
+        except OSError as e:
+            print(f"Error writing startup log: {e}")
+
+    def load_badge_icons(self):
+        """Fetch the role badge icons concurrently; until one arrives its role is shown by text styling only"""
+        started = time.perf_counter()
+        for name, url in BADGE_ICON_URLS.items():
+            future = self.image_executor.submit(self.image_cache.fetch, f"icon/{name}/3", url, (16, 16))
+            future.add_done_callback(
+                lambda f, name=name: self.root.after(0, self.on_badge_icon_loaded, name, f, started))
+
+    def on_badge_icon_loaded(self, name, future, started):
+        try:
+            img_data = future.result()
+            if img_data:
+                self.icon_images[name] = photo_image(img_data)
+        except Exception as e:
+            print(f"Error loading badge icon {name}: {e}")
+
+        self.pending_badge_icons.discard(name)
+        if not self.pending_badge_icons:
+            self.startup_timings['badge_icons'] = (time.perf_counter() - started) * 1000
+            self.log_startup_timings()
 
     def create_ui(self):
         """Create all UI components"""
@@ -100,10 +516,23 @@ class MultiPlatformChat:
                               borderwidth=0, command=self.toggle_overlay_mode, font=('Comic Sans MS', 10))
         self.overlay_btn.pack(side=tk.RIGHT, padx=2)
 
+        stats_btn = tk.Button(self.header, text="📊", bg='#333333', fg='white',
+                              borderwidth=0, command=self.toggle_stats, font=('Comic Sans MS', 10))
+        stats_btn.pack(side=tk.RIGHT, padx=2)
+
+        search_btn = tk.Button(self.header, text="🔍", bg='#333333', fg='white',
+                               borderwidth=0, command=self.open_search, font=('Comic Sans MS', 10))
+        search_btn.pack(side=tk.RIGHT, padx=2)
+
         title_label = tk.Label(self.header, text="Chat", bg='#333333', 
                              fg='white', font=('Comic Sans MS', 10))
         title_label.pack(side=tk.LEFT, padx=10)
 
+        # Packed under the header only while stats are shown
+        self.stats_var = tk.StringVar()
+        self.stats_label = tk.Label(self.root, textvariable=self.stats_var, bg='#26262c', fg='#adadb8',
+                                    anchor=tk.W, font=('Comic Sans MS', 8))
+
     def create_chat_display(self):
         """Create the main chat display area"""
         self.chat_display = scrolledtext.ScrolledText(
@@ -115,6 +544,7 @@ class MultiPlatformChat:
 
         self.chat_display.tag_configure("system", foreground="#ffaa00")
         self.chat_display.tag_configure("timestamp", foreground="#888888")
+        self.chat_display.tag_configure("channel", foreground="#6b6b75")
         self.chat_display.tag_configure("twitch_username", foreground="#9147ff")
         self.chat_display.tag_configure("youtube_username", foreground="#ff0000")
         self.chat_display.tag_configure("message", foreground="#ffffff")
@@ -127,6 +557,7 @@ class MultiPlatformChat:
         self.chat_display.tag_configure("vip", foreground="#ff69b4")
         self.chat_display.tag_configure("broadcaster", foreground="#ff0000")
         self.chat_display.tag_configure("bits", foreground="#ff4500")
+        self.chat_display.tag_configure("repeat_count", foreground="#adadb8", font=('Comic Sans MS', 9, 'bold'))
 
     def create_connection_controls(self):
         """Create connection control panels"""
@@ -171,7 +602,7 @@ class MultiPlatformChat:
 
         tk.Label(status_frame, text="Get Twitch Token", bg='#18181b', fg='#9147ff',
                 font=('Comic Sans MS', 8, 'underline'), cursor="hand2").pack(side=tk.RIGHT)
-        status_frame.winfo_children()[-1].bind("<Button-1>", lambda e: webbrowser.open(TOKEN_HELP_URL))
+        status_frame.winfo_children()[-1].bind("<Button-1>", lambda e: open_token_help())
 
     def create_overlay_controls(self):
         """Create overlay mode controls"""
@@ -230,252 +661,541 @@ class MultiPlatformChat:
             alpha = self.transparency_var.get() / 100.0
             self.root.wm_attributes('-alpha', alpha)
 
-    def load_badge_data(self):
-        """Load global and channel badge data from Twitch API"""
-        try:
-
-            response = requests.get(GLOBAL_BADGES_URL)
-            if response.status_code == 200:
-                self.global_badges = response.json().get('badge_sets', {})
-        except Exception as e:
-            print(f"Error loading global badge data: {e}")
-
-    def load_channel_badge_data(self, channel_id):
-        """Load channel-specific badge data"""
-        try:
-            url = CHANNEL_BADGES_URL.format(channel_id=channel_id)
-            response = requests.get(url)
-            if response.status_code == 200:
-                self.channel_badges = response.json().get('badge_sets', {})
-        except Exception as e:
-            print(f"Error loading channel badge data: {e}")
-
-    def get_badge_url(self, badge_name, badge_version):
-        """Get the URL for a badge image"""
-
-        if badge_name in self.channel_badges:
-            versions = self.channel_badges[badge_name].get('versions', {})
-            if badge_version in versions:
-                return versions[badge_version].get('image_url_1x')
-
-        if badge_name in self.global_badges:
-            versions = self.global_badges[badge_name].get('versions', {})
-            if badge_version in versions:
-                return versions[badge_version].get('image_url_1x')
-
-        return None
-
-    def load_badge_image(self, badge_name, badge_version):
+    def load_badge_image(self, badge_name, badge_version, room_id=None):
         """Load a badge image from Twitch"""
-        cache_key = f"{badge_name}_{badge_version}"
-        if cache_key in self.badge_cache:
-            return self.badge_cache[cache_key]
-
-        badge_url = self.get_badge_url(badge_name, badge_version)
+        badge_url = self.chat.get_badge_url(badge_name, badge_version, room_id)
         if not badge_url:
             return None
 
+        # Channel badges can share a name and version across rooms, so key by the image URL
+        cache_key = badge_url
+        if cache_key in self.badge_cache:
+            return self.badge_cache[cache_key]
+
         try:
-            response = requests.get(badge_url)
-            if response.status_code == 200:
-                img_data = response.content
-                img = Image.open(io.BytesIO(img_data))
-                img = img.resize((18, 18), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
+            img_data = self.image_cache.fetch(f"badge/{badge_url}", badge_url, (18, 18))
+            if img_data:
+                photo = photo_image(img_data)
                 self.badge_cache[cache_key] = photo
                 return photo
         except Exception as e:
+            self.chat.metrics.count('image_errors')
             print(f"Error loading badge image: {e}")
 
         return None
 
-    def load_emote_image(self, emote_id):
-        """Load an emote image from Twitch"""
-        if emote_id in self.emote_cache:
-            return self.emote_cache[emote_id]
-
+    def fetch_emote_image(self, emote_id):
+        """Return resized PNG bytes for a Twitch or third-party emote; safe to run off the Tk thread"""
         try:
-            emote_url = f"{EMOTE_BASE_URL}{emote_id}/default/dark/1.0"
-            response = requests.get(emote_url)
-            if response.status_code == 200:
-                img_data = response.content
-                img = Image.open(io.BytesIO(img_data))
-                img = img.resize((24, 24), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-                self.emote_cache[emote_id] = photo
-                return photo
+            emote_url = (self.chat.emote_providers.image_url(emote_id) or self.chat.youtube_emoji_urls.get(emote_id)
+                         or f"{EMOTE_BASE_URL}{emote_id}/default/dark/1.0")
+            return self.image_cache.fetch(f"emote/{emote_id}/1.0", emote_url, (24, 24))
         except Exception as e:
+            self.chat.metrics.count('image_errors')
             print(f"Error loading emote image: {e}")
 
         return None
 
-    def add_message(self, platform, username, message, color=None, badges=None, is_donation=False, is_highlight=False, bits=0, emotes=None):
-        if self.overlay_mode and not self.chat_display.winfo_viewable():
+    def request_emote_image(self, emote_id):
+        """Start a background fetch for an uncached emote, sharing one download per emote ID"""
+        if emote_id in self.emote_inflight:
+            return
+        retry_at = self.emote_failed.get(emote_id)
+        if retry_at is not None:
+            # A broken emote keeps its text placeholder instead of refetching on every message
+            if retry_at > time.monotonic():
+                return
+            del self.emote_failed[emote_id]
+        self.emote_inflight.add(emote_id)
+        future = self.image_executor.submit(self.fetch_emote_image, emote_id)
+        future.add_done_callback(lambda f: self.root.after(0, self.on_emote_loaded, emote_id, f.result()))
+
+    def on_emote_loaded(self, emote_id, img_data):
+        """Replace every placeholder for emote_id in chat_display with the loaded image, or note the failure"""
+        self.emote_inflight.discard(emote_id)
+        placeholder_tag = f"emote_{emote_id}"
+        photo = None
+        if img_data:
+            try:
+                photo = photo_image(img_data)
+            except Exception as e:
+                self.chat.metrics.count('image_errors')
+                print(f"Error decoding emote image: {e}")
+        if photo is None:
+            # The placeholders stay tagged, so a retry after IMAGE_FAILURE_TTL can still swap them
+            self.emote_failed[emote_id] = time.monotonic() + IMAGE_FAILURE_TTL
             return
+        self.emote_cache[emote_id] = photo
+
+        ranges = self.chat_display.tag_ranges(placeholder_tag)
+        if ranges:
+            self.chat_display.config(state=tk.NORMAL)
+            # Walk backwards so earlier indices stay valid as each placeholder shrinks to one image
+            for i in range(len(ranges) - 2, -1, -2):
+                start, end = ranges[i], ranges[i + 1]
+                self.chat_display.delete(start, end)
+                self.embed_image(start, photo)
+            self.chat_display.config(state=tk.DISABLED)
+        self.chat_display.tag_delete(placeholder_tag)
+
+    def embed_image(self, index, photo):
+        """Insert photo into chat_display at index and hold a reference while it is shown"""
+        self.chat_display.image_create(index, image=photo)
+        entry = self.embedded_images.setdefault(str(photo), [photo, 0])
+        entry[1] += 1
+
+    def release_images(self, start, end):
+        """Drop the references embed_image holds for images between start and end, before they are deleted"""
+        for _, _, index in self.chat_display.dump(start, end, image=True):
+            name = str(self.chat_display.image_cget(index, 'image'))
+            entry = self.embedded_images.get(name)
+            if entry:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self.embedded_images[name]
+
+    def queue_records(self, records):
+        """Queue a batch of chat records so they land in the same render frame (safe to call from any thread)"""
+        records = [record for record in records if not record.hidden]
+        self.render_queue.extend(records)
+        self.ingest_count += len(records)
+
+    def render_frame(self):
+        """Drain up to max_messages_per_frame queued messages in a single widget update"""
+        try:
+            now = time.monotonic()
+            self.update_rates(now)
+            if self.shed_enabled:
+                self.shed_load(now)
+
+            count = min(len(self.render_queue), self.max_messages_per_frame)
+            if count:
+                records = [self.render_queue.popleft() for _ in range(count)]
+                waited = sum(now - record.queued_at for record in records)
+                self.chat.metrics.observe('queue_wait', waited, count, now - records[0].queued_at)
+                if not (self.overlay_mode and not self.chat_display.winfo_viewable()):
+                    started = time.perf_counter()
+                    self.display_records(records)
+                    self.chat.metrics.observe('render', time.perf_counter() - started, count)
+                self.render_count += count
+                if self.render_queue:
+                    self.render_saturated = True
+
+            depth = len(self.render_queue)
+            if depth != self.render_queue_depth:
+                self.render_queue_depth = depth
+                self.update_status()
+        finally:
+            self.root.after(self.render_frame_ms, self.render_frame)
+
+    def update_rates(self, now):
+        """Refresh the ingest and render rates once per RATE_WINDOW"""
+        elapsed = now - self.rate_window_start
+        if elapsed < RATE_WINDOW:
+            return
+        self.ingest_rate = self.ingest_count / elapsed
+        # Only a window with a backlog shows what rendering can sustain; idle windows just echo the ingest rate
+        if self.render_saturated:
+            self.render_rate = 0.5 * self.render_rate + 0.5 * (self.render_count / elapsed)
+        self.ingest_count = 0
+        self.render_count = 0
+        self.render_saturated = False
+        self.rate_window_start = now
+        if self.show_stats:
+            self.update_stats()
+
+    def toggle_stats(self):
+        self.show_stats = not self.show_stats
+        if self.show_stats:
+            self.stats_label.pack(fill=tk.X, after=self.header)
+            self.update_stats()
+        else:
+            self.stats_label.pack_forget()
+
+    def update_stats(self):
+        """Refresh the stats strip with rates and the mean time per stage since the last refresh"""
+        totals = self.chat.metrics.stage_totals()
+        stage_ms = {}
+        for stage, (count, total) in totals.items():
+            last_count, last_total = self.stats_totals.get(stage, (0, 0.0))
+            if count > last_count:
+                stage_ms[stage] = (total - last_total) * 1000 / (count - last_count)
+        self.stats_totals = totals
+
+        parts = [f"In {self.ingest_rate:.0f}/s", f"Render {self.render_rate:.0f}/s"]
+        for stage, label in (('parse', 'Parse'), ('queue_wait', 'Wait'), ('render', 'Draw'), ('image_fetch', 'Image')):
+            if stage in stage_ms:
+                parts.append(f"{label} {stage_ms[stage]:.2f} ms")
+        parts.append(f"Layouts {self.chat.emote_layouts.hit_ratio():.0%}")
+        parts.append(f"Images {self.image_cache.hit_ratio():.0%}")
+        http = self.chat.http.stats().values()
+        requests = sum(stats['requests'] for stats in http)
+        if requests:
+            average = sum(stats['avg_ms'] * stats['requests'] for stats in http) / requests
+            errors = sum(stats['errors'] for stats in http)
+            parts.append(f"HTTP {average:.0f} ms" + (f", {errors} failed" if errors else ""))
+        parts.append(f"Queue {self.render_queue_depth}")
+        if self.shed_total:
+            parts.append(f"Skipped {self.shed_total}")
+        self.stats_var.set(" | ".join(parts))
+
+    def collect_metrics(self):
+        """Gauges for metrics snapshots; called on the engine thread, so it only reads plain values"""
+        return {
+            'render_queue_depth': len(self.render_queue),
+            'ingest_rate': self.ingest_rate,
+            'render_rate': self.render_rate,
+            'emote_image_hit_ratio': self.emote_cache.hit_ratio(),
+            'image_cache_hit_ratio': self.image_cache.hit_ratio(),
+            **{f'image_cache_{name}': value for name, value in self.image_cache.stats().items()}
+        }
 
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        username_tag = f"{platform}_username"
+    def shed_load(self, now):
+        """Drop the lowest-priority queued messages when the oldest one is older than the latency bound"""
+        queue = self.render_queue
+        if len(queue) <= self.max_messages_per_frame:
+            return
+        if (now - queue[0].queued_at) * 1000 <= self.shed_max_latency_ms:
+            return
 
-        self.chat_display.config(state=tk.NORMAL)
+        budget = max(self.max_messages_per_frame, int(self.render_rate * self.shed_max_latency_ms / 1000))
+        records = list(queue)
+        if len(records) <= budget:
+            return
 
-        self.chat_display.insert(tk.END, f"[{timestamp}] ", "timestamp")
+        counts = [0] * (PRIORITY_SYSTEM + 1)
+        priorities = [record.priority() for record in records]
+        for priority in priorities:
+            counts[priority] += 1
+        # Bits, highlights and system lines are never shed, so a backlog of only those is left alone
+        if not any(counts[:MAX_SHED_PRIORITY + 1]):
+            return
 
-        inserted_icon = False
+        # Raise the cutoff one class at a time until what is left fits the budget
+        cutoff = 0
+        remaining = len(records)
+        while cutoff <= MAX_SHED_PRIORITY and remaining > budget:
+            remaining -= counts[cutoff]
+            cutoff += 1
+        if cutoff == 0:
+            return
 
-        if platform == 'twitch' and badges:
-            priority = ["broadcaster", "moderator", "vip", "subscriber", "prime", "subtember"]
-            seen = set()
-            for badge_name, _ in badges:
-                if badge_name in priority and badge_name in self.icon_images and badge_name not in seen:
-                    self.chat_display.image_create(tk.END, image=self.icon_images[badge_name])
-                    self.chat_display.insert(tk.END, " ")
-                    seen.add(badge_name)
-                    inserted_icon = True
-                    break
+        # The last class crossed is only trimmed down to the budget, keeping its newest messages
+        partial = cutoff - 1
+        partial_drop = counts[partial] - max(0, budget - remaining)
+        kept = []
+        marker = None
+        skipped = 0
+        for record, priority in zip(records, priorities):
+            if priority == partial and partial_drop <= 0:
+                kept.append(record)
+            elif priority >= cutoff:
+                kept.append(record)
+            else:
+                if priority == partial:
+                    partial_drop -= 1
+                if marker is None:
+                    marker = ChatRecord('system', record.timestamp, None, None, '')
+                    kept.append(marker)
+                skipped += 1
+        marker.message = f"{skipped} messages skipped to keep up with chat"
+
+        # Rewrite the front of the deque in place so listeners can keep appending to its end
+        for _ in range(len(records)):
+            queue.popleft()
+        queue.extendleft(reversed(kept))
+        self.shed_total += skipped
+        self.chat.metrics.count('skipped', skipped)
+
+    def collapse_repeat(self, line, now):
+        """Return the earlier on-screen line this one repeats, after bumping its counter"""
+        record = line.record
+        if not self.repeat_index.window or record.kind != 'chat' or record.is_donation or record.is_highlight:
+            return None
 
-        username_style = username_tag
-        if platform == 'twitch':
-            if any(badge[0] == 'broadcaster' for badge in badges or []):
-                username_style = "broadcaster"
-            elif any(badge[0] == 'moderator' for badge in badges or []):
-                username_style = "moderator"
-            elif any(badge[0] == 'vip' for badge in badges or []):
-                username_style = "vip"
-            elif any(badge[0] == 'subscriber' for badge in badges or []):
-                username_style = "subscriber"
-            elif any(badge[0] == 'prime' for badge in badges or []):
-                username_style = "prime"
-            elif any(badge[0] == 'premium' for badge in badges or []):  
-                username_style = "vip" 
-
-        icon_type = None
-        if platform == 'twitch':
-            if any(badge[0] == 'broadcaster' for badge in badges or []):
-                icon_type = "broadcaster"
-            elif any(badge[0] == 'moderator' for badge in badges or []):
-                icon_type = "moderator"
-            elif any(badge[0] == 'vip' for badge in badges or []):
-                icon_type = "vip"
-            elif any(badge[0] == 'subscriber' for badge in badges or []):
-                icon_type = "subscriber"
+        key = RepeatIndex.key(record.message)
+        original = self.repeat_index.get(key, now)
+        if original is not None:
+            oldest_shown = self.chat_model.first_seq if self.display_mode == 'virtual' else self.lines_trimmed
+            if original.seq >= oldest_shown and self.display_seq - original.seq <= REPEAT_MAX_DISTANCE:
+                original.repeat += 1
+                self.collapsed_total += 1
+                return original
 
-        self.chat_display.insert(tk.END, f"{username}: ", username_style)
+        self.repeat_index.add(key, line, now)
+        return None
 
-        message_style = "message"
-        if is_donation:
-            message_style = "donation"
-            if bits > 0:
-                message = f"Cheered {bits} bits: {message}"
-        elif is_highlight:
-            message_style = "highlight"
+    def update_repeat_count(self, line):
+        """Rewrite the ×N counter at the end of a collapsed line; the widget must already be NORMAL"""
+        line_end = f"{line.seq - self.lines_trimmed + 1}.end"
+        if line.shown_repeat > 1:
+            self.chat_display.delete(f"{line_end} -{len(f' ×{line.shown_repeat}')}c", line_end)
+        self.chat_display.insert(line_end, f" ×{line.repeat}", "repeat_count")
+        line.shown_repeat = line.repeat
+
+    def display_records(self, records):
+        """Show records in chat_display with one state toggle and one scroll"""
+        now = time.monotonic()
+        if self.display_mode == 'virtual':
+            for record in records:
+                line = DisplayLine(record, self.display_seq)
+                if self.collapse_repeat(line, now):
+                    continue
+                self.display_seq += 1
+                self.chat_model.append(line)
+            if self.virtual_top is None or self.virtual_top < self.chat_model.first_seq:
+                self.refresh_virtual_view()
+            else:
+                # Scrolled back through history: the rows in view are unchanged, only the scrollbar moves
+                self.update_virtual_scrollbar()
+            return
+
+        self.chat_display.config(state=tk.NORMAL)
+        repeated = {}
+        for record in records:
+            line = DisplayLine(record, self.display_seq)
+            original = self.collapse_repeat(line, now)
+            if original:
+                repeated[id(original)] = original
+                continue
+            try:
+                self.render_record(line)
+                self.record_scrollback_line(record.size())
+            except Exception as e:
+                self.chat.metrics.count('render_errors')
+                print(f"Error rendering message: {e}")
+        for original in repeated.values():
+            self.update_repeat_count(original)
+        self.trim_scrollback()
+        self.chat_display.config(state=tk.DISABLED)
+        self.chat_display.see(tk.END)
 
-        if platform == 'twitch' and emotes:
-            message_parts = []
-            last_pos = 0
-            text = message
+    def render_record(self, line):
+        """Insert one DisplayLine at the end of chat_display; the widget must already be NORMAL"""
+        record = line.record
+        if record.kind == 'system':
+            self._render_system_message(record)
+        else:
+            self._render_message(record)
+        if line.repeat > 1:
+            self.chat_display.insert(tk.END, f" ×{line.repeat}", "repeat_count")
+        line.shown_repeat = line.repeat
+        self.chat_display.insert(tk.END, "\n")
 
-            emote_positions = []
-            for emote_id, positions in emotes:
-                for pos in positions:
-                    start, end = map(int, pos.split('-'))
-                    emote_positions.append((start, end, emote_id))
+    def _render_message(self, record):
+        platform = record.platform
+        username = record.username
+        message = record.message
+        username_tag = f"{platform}_username"
 
-            emote_positions.sort()
+        self.chat_display.insert(tk.END, f"[{record.timestamp}] ", "timestamp")
 
-            for start, end, emote_id in emote_positions:
-                if start > last_pos:
-                    message_parts.append(text[last_pos:start])
+        if record.channel and len(self.chat.twitch_channels) > 1:
+            self.chat_display.insert(tk.END, f"#{record.channel} ", "channel")
 
-                emote_img = self.load_emote_image(emote_id)
-                if emote_img:
-                    message_parts.append(emote_img)
-                else:
-                    message_parts.append(text[start:end+1])
+        icon_name = ROLE_ICONS[record.roles] if platform == 'twitch' else None
+        if icon_name in self.icon_images:
+            self.chat_display.image_create(tk.END, image=self.icon_images[icon_name])
+            self.chat_display.insert(tk.END, " ")
 
-                last_pos = end + 1
+        username_style = ROLE_STYLES[record.roles] or username_tag
 
-            if last_pos < len(text):
-                message_parts.append(text[last_pos:])
+        self.chat_display.insert(tk.END, f"{one_line(username)}: ", username_style)
 
-            for part in message_parts:
-                if isinstance(part, str):
-                    self.chat_display.insert(tk.END, part, message_style)
+        message_style = "message"
+        if record.is_donation:
+            message_style = "donation"
+        elif record.is_highlight:
+            message_style = "highlight"
+        message_style = (message_style, self.rule_color_tag(record.rule_color)) if record.rule_color else (message_style,)
+        if record.is_donation and record.bits > 0:
+            self.chat_display.insert(tk.END, f"Cheered {record.bits} bits: ", message_style)
+
+        if record.emotes:
+            for text, emote_id in record.emotes:
+                if emote_id is None:
+                    self.chat_display.insert(tk.END, one_line(text), message_style)
+                    continue
+                emote_img = self.emote_cache.get(emote_id)
+                if emote_img:
+                    self.embed_image(tk.END, emote_img)
                 else:
-                    self.chat_display.image_create(tk.END, image=part)
+                    # Show the emote name until the image arrives, tagged so it can be swapped in place
+                    self.request_emote_image(emote_id)
+                    self.chat_display.insert(tk.END, text, message_style + (f"emote_{emote_id}",))
         else:
-            self.chat_display.insert(tk.END, message, message_style)
+            self.chat_display.insert(tk.END, one_line(message), message_style)
 
-        self.chat_display.insert(tk.END, "\n")
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+    def is_known_color(self, color):
+        """Whether Tk can display color, so a rule with a misspelled name is skipped instead of breaking renders"""
+        try:
+            self.root.winfo_rgb(color)
+            return True
+        except tk.TclError:
+            return False
+
+    def rule_color_tag(self, color):
+        """The text tag for a filter rule's color, configured on first use"""
+        tag = f"rule_{color.replace(' ', '_')}"
+        if tag not in self.rule_color_tags:
+            self.chat_display.tag_configure(tag, foreground=color)
+            self.rule_color_tags.add(tag)
+        return tag
 
     def add_system_message(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
+        self.display_records([ChatRecord('system', timestamp, None, None, message)])
+
+    def _render_system_message(self, record):
+        self.chat_display.insert(tk.END, f"[{record.timestamp}] ", "timestamp")
+        self.chat_display.insert(tk.END, one_line(record.message), "system")
+
+    def set_display_mode(self, mode):
+        """Switch chat_display between plain 'text' scrollback and the 'virtual' windowed view"""
+        if mode not in ('text', 'virtual'):
+            mode = 'text'
+        self.display_mode = mode
+        self.virtual_top = None
+
+        if mode == 'virtual':
+            self.chat_model = RingBuffer(self.virtual_history_size)
+            self.virtual_line_height = max(1, tkfont.Font(font=self.chat_display.cget('font')).metrics('linespace'))
+            # The widget only holds the rows in view, so the scrollbar tracks the model instead
+            self.chat_display.config(yscrollcommand='')
+            self.chat_display.vbar.config(command=self.on_virtual_scroll)
+            self.chat_display.bind('<MouseWheel>', self.on_virtual_wheel)
+            self.chat_display.bind('<Button-4>', self.on_virtual_wheel)
+            self.chat_display.bind('<Button-5>', self.on_virtual_wheel)
+            self.chat_display.bind('<Configure>', lambda e: self.refresh_virtual_view())
+        else:
+            self.chat_model = None
+            self.chat_display.config(yscrollcommand=self.chat_display.vbar.set)
+            self.chat_display.vbar.config(command=self.chat_display.yview)
+            for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>', '<Configure>'):
+                self.chat_display.unbind(sequence)
 
         self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, f"[{timestamp}] ", "timestamp")
-        self.chat_display.insert(tk.END, f"{message}\n", "system")
+        self.chat_display.delete('1.0', tk.END)
         self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
-
-    def get_twitch_channel_id(self, channel_name):
-        """Get Twitch channel ID from login name"""
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.twitch_token}'
-            }
-            params = {'login': channel_name}
-            response = requests.get(f"{TWITCH_API_BASE}/users", headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('data'):
-                    return data['data'][0]['id']
-        except Exception as e:
-            print(f"Error getting channel ID: {e}")
-        return None
+        self.embedded_images.clear()
+        self.scrollback_sizes.clear()
+        self.scrollback_bytes = 0
+        self.display_seq = 0
+        self.lines_trimmed = 0
+        self.repeat_index.clear()
+
+    def virtual_visible_rows(self):
+        return max(1, self.chat_display.winfo_height() // self.virtual_line_height)
+
+    def update_virtual_scrollbar(self):
+        total = len(self.chat_model)
+        if total:
+            top = self.current_virtual_index()
+            self.chat_display.vbar.set(top / total, min(1.0, (top + self.virtual_visible_rows()) / total))
+        else:
+            self.chat_display.vbar.set(0.0, 1.0)
 
-    def connect_twitch(self):
-        if not self.twitch_token:
-            if not self.prompt_twitch_token():
-                return
+    def refresh_virtual_view(self):
+        """Rebind the rows around the current scroll position from the model"""
+        model = self.chat_model
+        total = len(model)
+        rows = self.virtual_visible_rows()
 
-        self.twitch_channel = self.twitch_channel_var.get().strip().lower()
-        if not self.twitch_channel:
-            messagebox.showerror("Error", "Please enter a Twitch channel name")
-            return
+        if self.virtual_top is None:
+            top = max(0, total - rows)
+            first, last = max(0, top - VIRTUAL_MARGIN_ROWS), total
+        else:
+            top = min(max(0, self.virtual_top - model.first_seq), max(0, total - 1))
+            first, last = max(0, top - VIRTUAL_MARGIN_ROWS), min(total, top + rows + VIRTUAL_MARGIN_ROWS)
 
-        try:
+        self.chat_display.config(state=tk.NORMAL)
+        self.chat_display.delete('1.0', tk.END)
+        self.embedded_images.clear()
+        for i in range(first, last):
+            try:
+                self.render_record(model[i])
+            except Exception as e:
+                self.chat.metrics.count('render_errors')
+                print(f"Error rendering message: {e}")
+        self.chat_display.config(state=tk.DISABLED)
 
-            self.twitch_channel_id = self.get_twitch_channel_id(self.twitch_channel)
-            if self.twitch_channel_id:
-                self.load_channel_badge_data(self.twitch_channel_id)
+        if self.virtual_top is None:
+            self.chat_display.see(tk.END)
+        else:
+            self.chat_display.yview(f'{top - first + 1}.0')
+        self.update_virtual_scrollbar()
+
+    def scroll_virtual_to(self, index):
+        """Scroll the virtual view so model row index is at the top; past the end follows new messages"""
+        total = len(self.chat_model)
+        if index >= total - self.virtual_visible_rows():
+            self.virtual_top = None
+        else:
+            self.virtual_top = self.chat_model.first_seq + max(0, int(index))
+        self.refresh_virtual_view()
+
+    def current_virtual_index(self):
+        total = len(self.chat_model)
+        if self.virtual_top is None:
+            return max(0, total - self.virtual_visible_rows())
+        return self.virtual_top - self.chat_model.first_seq
+
+    def on_virtual_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll_virtual_to(float(amount) * len(self.chat_model))
+        else:
+            step = self.virtual_visible_rows() if unit == 'pages' else 1
+            self.scroll_virtual_to(self.current_virtual_index() + int(amount) * step)
 
-            context = ssl.create_default_context()
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.twitch_sock = context.wrap_socket(sock, server_hostname=TWITCH_SERVER)
-            self.twitch_sock.connect((TWITCH_SERVER, TWITCH_PORT))
+    def on_virtual_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            direction = -3
+        else:
+            direction = 3
+        self.scroll_virtual_to(self.current_virtual_index() + direction)
+        return "break"
+
+    def record_scrollback_line(self, size):
+        """Track the approximate size of a line just appended to chat_display"""
+        self.scrollback_sizes.append(size)
+        self.scrollback_bytes += size
+        self.display_seq += 1
+
+    def trim_scrollback(self):
+        """Delete the oldest lines in one chunk once the scrollback limits are exceeded"""
+        max_lines = self.max_scrollback_lines
+        max_bytes = self.max_scrollback_bytes
+        over_lines = max_lines and len(self.scrollback_sizes) > max_lines
+        over_bytes = max_bytes and self.scrollback_bytes > max_bytes
+        if not (over_lines or over_bytes):
+            return
 
-            commands = [
-                f"PASS {self.twitch_token}",
-                "NICK justinfan12345",
-                "CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership",
-                f"JOIN #{self.twitch_channel}"
-            ]
+        # Trim below the limit so the delete happens once per chunk, not once per message
+        target_lines = max(0, max_lines - SCROLLBACK_TRIM_CHUNK) if max_lines else len(self.scrollback_sizes)
+        target_bytes = max_bytes * 0.9 if max_bytes else self.scrollback_bytes
+        count = 0
+        while self.scrollback_sizes and (len(self.scrollback_sizes) > target_lines or self.scrollback_bytes > target_bytes):
+            self.scrollback_bytes -= self.scrollback_sizes.popleft()
+            count += 1
+        self.lines_trimmed += count
 
-            for cmd in commands:
-                self.twitch_sock.send(f"{cmd}\r\n".encode('utf-8'))
+        # Deleting the range also drops the widget's tag ranges; the images are released first
+        self.release_images('1.0', f'{count + 1}.0')
+        self.chat_display.delete('1.0', f'{count + 1}.0')
 
-            self.connected_services['twitch'] = True
-            self.twitch_connect_btn.config(text="Disconnect", bg='#ff4444')
-            self.update_status()
-            self.add_system_message(f"Connected to Twitch channel #{self.twitch_channel}")
+    def connect_twitch(self):
+        if not self.chat.twitch_token:
+            if not self.prompt_twitch_token():
+                return
 
-            thread = threading.Thread(target=self.twitch_chat_listener, daemon=True)
-            thread.start()
-            self.chat_threads.append(thread)
+        channels = self.chat.parse_twitch_channels(self.twitch_channel_var.get())
+        if not channels:
+            messagebox.showerror("Error", "Please enter a Twitch channel name")
+            return
 
-        except Exception as e:
-            self.add_system_message(f"Twitch connection error: {e}")
+        self.chat.start_twitch(channels)
+        self.twitch_connect_btn.config(text="Disconnect", bg='#ff4444')
+        self.update_status()
 
     def connect_youtube(self):
         youtube_input = self.youtube_input_var.get().strip()
@@ -483,41 +1203,20 @@ class MultiPlatformChat:
             messagebox.showerror("Error", "Please enter a YouTube channel name, video ID, or URL")
             return
 
-        try:
-            video_id = self.extract_video_id_from_url(youtube_input)
-
-            if not video_id:
-                if len(youtube_input) == 11 and not youtube_input.startswith('@'):
-                    video_id = youtube_input
-                else:
-                    self.add_system_message("Searching for live stream...")
-                    video_id = self.get_live_video_from_channel(youtube_input)
-
-                    if not video_id:
-                        self.add_system_message("No live stream found. Please try a video ID or URL.")
-                        return
-
-            self.youtube_video_id = video_id
-            self.youtube_chat = pytchat.create(video_id=video_id)
-
-            self.connected_services['youtube'] = True
-            self.youtube_connect_btn.config(text="Disconnect", bg='#ff4444')
-            self.update_status()
-            self.add_system_message(f"Connected to YouTube video {video_id}")
-
-            thread = threading.Thread(target=self.youtube_chat_listener, daemon=True)
-            thread.start()
-            self.chat_threads.append(thread)
+        video_id = self.chat.youtube_video_from_input(youtube_input)
+        if not video_id and not self.chat.youtube_api_key:
+            # The key prompt is a Tk dialog, so it has to happen before handing off to the engine
+            self.chat.youtube_api_key = self.prompt_youtube_api_key()
+            if not self.chat.youtube_api_key:
+                return
 
-        except Exception as e:
-            self.add_system_message(f"YouTube connection error: {e}")
+        self.chat.start_youtube(youtube_input, video_id)
+        self.youtube_connect_btn.config(text="Disconnect", bg='#ff4444')
+        self.update_status()
 
     def disconnect_twitch(self):
         try:
-            if self.twitch_sock:
-                self.twitch_sock.close()
-
-            self.connected_services['twitch'] = False
+            self.chat.stop_service('twitch')
             self.twitch_connect_btn.config(text="Connect", bg='#9147ff')
             self.update_status()
             self.add_system_message("Disconnected from Twitch")
@@ -527,10 +1226,7 @@ class MultiPlatformChat:
 
     def disconnect_youtube(self):
         try:
-            if self.youtube_chat:
-                self.youtube_chat.terminate()
-
-            self.connected_services['youtube'] = False
+            self.chat.stop_service('youtube')
             self.youtube_connect_btn.config(text="Connect", bg='#ff0000')
             self.update_status()
             self.add_system_message("Disconnected from YouTube")
@@ -540,176 +1236,55 @@ class MultiPlatformChat:
 
     def toggle_connection(self, platform):
         if platform == 'twitch':
-            if not self.connected_services['twitch']:
+            if not self.chat.connected_services['twitch']:
                 self.connect_twitch()
             else:
                 self.disconnect_twitch()
         elif platform == 'youtube':
-            if not self.connected_services['youtube']:
+            if not self.chat.connected_services['youtube']:
                 self.connect_youtube()
             else:
                 self.disconnect_youtube()
 
-    def twitch_chat_listener(self):
-        while self.connected_services['twitch']:
-            try:
-                resp = self.twitch_sock.recv(2048).decode('utf-8')
-
-                if not resp:
-                    self.root.after(0, self.disconnect_twitch)
-                    break
-
-                if resp.startswith('PING'):
-                    self.twitch_sock.send("PONG :tmi.twitch.tv\r\n".encode('utf-8'))
+    def on_engine_event(self, event, platform, detail):
+        """Engine watcher; runs on engine threads, so the work is handed to the Tk thread"""
+        self.root.after(0, self.handle_engine_event, event, platform, detail)
+
+    def handle_engine_event(self, event, platform, detail):
+        if event == 'ended':
+            if self.chat.end_session(platform, detail):
+                if platform == 'twitch':
+                    self.disconnect_twitch()
+                elif platform == 'youtube':
+                    self.disconnect_youtube()
                 else:
-                    for line in resp.split('\r\n'):
-                        if not line:
-                            continue
-
-                        username, message, color, badges, is_donation, is_highlight, bits, emotes = self.parse_twitch_message(line)
-                        if username and message:
-                            self.root.after(0, self.add_message, 'twitch', username, message, color, badges, is_donation, is_highlight, bits, emotes)
-
-            except Exception as e:
-                self.root.after(0, self.add_system_message, f"Twitch chat error: {e}")
-                self.root.after(0, self.disconnect_twitch)
-                break
-
-    def youtube_chat_listener(self):
-        while self.connected_services['youtube'] and self.youtube_chat.is_alive():
-            try:
-                for c in self.youtube_chat.get().sync_items():
-                    self.root.after(0, self.add_message, 'youtube', c.author.name, c.message)
-
-            except Exception as e:
-                self.root.after(0, self.add_system_message, f"YouTube chat error: {e}")
-                self.root.after(0, self.disconnect_youtube)
-                break
-
-    def parse_twitch_message(self, irc_message):
-        tags = {}
-        username = None
-        message = None
-        color = None
-        badges = []
-        is_donation = False
-        is_highlight = False
-        bits = 0
-        emotes = []
-
-        if irc_message.startswith('@'):
-            tag_part, irc_message = irc_message.split(' ', 1)
-            for tag in tag_part[1:].split(';'):
-                if '=' in tag:
-                    key, value = tag.split('=', 1)
-                    tags[key] = value
-
-        privmsg_match = re.match(r':([^!]+)![^ ]+ PRIVMSG #[^ ]+ :(.*)', irc_message)
-        if privmsg_match:
-            username = privmsg_match.group(1)
-            message = privmsg_match.group(2)
-
-            is_donation = any(word in message.lower() for word in ['donated', 'donation', 'cheered'])
-            is_highlight = 'msg-id=highlighted-message' in tags.get('flags', '')
-
-            if 'bits' in tags:
-                try:
-                    bits = int(tags['bits'])
-                    is_donation = True
-                except:
-                    pass
-
-            color = tags.get('color')
-            if color:
-                color = f'#{color}' if not color.startswith('#') else color
-
-            badge_info = tags.get('badges', '')
-            if badge_info:
-                for badge in badge_info.split(','):
-                    badge_parts = badge.split('/', 1)
-                    if len(badge_parts) == 2:
-                        badge_name, badge_version = badge_parts
-                        badges.append((badge_name, badge_version))
-
-            emote_info = tags.get('emotes', '')
-            if emote_info:
-                for emote in emote_info.split('/'):
-                    emote_parts = emote.split(':')
-                    if len(emote_parts) >= 2:
-                        emotes.append((emote_parts[0], emote_parts[1:]))
-
-        return username, message, color, badges, is_donation, is_highlight, bits, emotes
-
-    def get_live_video_from_channel(self, channel_input):
-        if not self.youtube_api_key:
-            self.youtube_api_key = self.prompt_youtube_api_key()
-            if not self.youtube_api_key:
-                return None
-
-        try:
-            if channel_input.startswith('@'):
-                channel_input = channel_input[1:]
-
-            if channel_input.startswith('UC') and len(channel_input) == 24:
-                channel_id = channel_input
-            else:
-                search_url = f"{YOUTUBE_API_BASE}/search"
-                params = {
-                    'part': 'snippet',
-                    'q': channel_input,
-                    'type': 'channel',
-                    'maxResults': 1,
-                    'key': self.youtube_api_key
-                }
-
-                response = requests.get(search_url, params=params)
-                data = response.json()
-
-                if 'items' not in data or not data['items']:
-                    return None
-
-                channel_id = data['items'][0]['snippet']['channelId']
-
-            search_url = f"{YOUTUBE_API_BASE}/search"
-            params = {
-                'part': 'snippet',
-                'channelId': channel_id,
-                'eventType': 'live',
-                'type': 'video',
-                'maxResults': 1,
-                'key': self.youtube_api_key
-            }
-
-            response = requests.get(search_url, params=params)
-            data = response.json()
-
-            if 'items' in data and data['items']:
-                return data['items'][0]['id']['videoId']
-
-        except Exception as e:
-            self.add_system_message(f"YouTube API error: {e}")
-
-        return None
-
-    def extract_video_id_from_url(self, url):
-        if 'youtube.com/watch' in url:
-            parsed = urlparse(url)
-            return parse_qs(parsed.query).get('v', [None])[0]
-        elif 'youtu.be/' in url:
-            return url.split('youtu.be/')[-1].split('?')[0]
-        return None
+                    self.update_status()
+        else:
+            self.update_status()
 
     def load_settings(self):
         try:
-            if os.path.exists(SETTINGS_FILE):
-                with open(SETTINGS_FILE, 'r') as f:
-                    settings = json.load(f)
-
-                self.twitch_token = settings.get('twitch_token')
+            self.settings_mtime = self.settings_file_mtime()
+            settings = read_settings()
+            if settings:
+                self.chat.apply_settings(settings)
                 self.twitch_channel_var.set(settings.get('twitch_channel', ''))
                 self.youtube_input_var.set(settings.get('youtube_input', ''))
-                self.youtube_api_key = settings.get('youtube_api_key')
                 self.transparency_var.set(settings.get('transparency', 90))
+                self.render_frame_ms = max(1, int(settings.get('render_frame_ms', RENDER_FRAME_MS)))
+                self.max_messages_per_frame = max(1, int(settings.get('max_messages_per_frame', MAX_MESSAGES_PER_FRAME)))
+                self.max_scrollback_lines = max(0, int(settings.get('max_scrollback_lines', MAX_SCROLLBACK_LINES)))
+                self.max_scrollback_bytes = max(0, int(settings.get('max_scrollback_bytes', MAX_SCROLLBACK_BYTES)))
+                self.virtual_history_size = max(100, int(settings.get('virtual_history_size', VIRTUAL_HISTORY_SIZE)))
+                self.shed_enabled = bool(settings.get('shed_enabled', True))
+                self.shed_max_latency_ms = max(100, int(settings.get('shed_max_latency_ms', SHED_MAX_LATENCY_MS)))
+                self.repeat_index.window = max(0.0, float(settings.get('repeat_window', REPEAT_WINDOW)))
+                self.set_display_mode(settings.get('display_mode', 'text'))
+                # After set_display_mode, which clears the chat and would take these with it
+                self.report_rule_errors(self.chat.rules.errors)
+                if bool(settings.get('show_stats', False)) != self.show_stats:
+                    self.toggle_stats()
+                self.history_enabled = bool(settings.get('history_enabled', True))
 
         except Exception as e:
             self.add_system_message(f"Error loading settings: {e}")
@@ -717,18 +1292,156 @@ class MultiPlatformChat:
     def save_settings(self):
         try:
             settings = {
-                'twitch_token': self.twitch_token,
+                **self.chat.settings(),
                 'twitch_channel': self.twitch_channel_var.get(),
                 'youtube_input': self.youtube_input_var.get(),
-                'youtube_api_key': self.youtube_api_key,
-                'transparency': self.transparency_var.get()
+                'transparency': self.transparency_var.get(),
+                'render_frame_ms': self.render_frame_ms,
+                'max_messages_per_frame': self.max_messages_per_frame,
+                'max_scrollback_lines': self.max_scrollback_lines,
+                'max_scrollback_bytes': self.max_scrollback_bytes,
+                'display_mode': self.display_mode,
+                'virtual_history_size': self.virtual_history_size,
+                'shed_enabled': self.shed_enabled,
+                'shed_max_latency_ms': self.shed_max_latency_ms,
+                'repeat_window': self.repeat_index.window,
+                'show_stats': self.show_stats,
+                'history_enabled': self.history_enabled
             }
 
             with open(SETTINGS_FILE, 'w') as f:
                 json.dump(settings, f, indent=2)
+            self.settings_mtime = self.settings_file_mtime()
         except Exception as e:
             self.add_system_message(f"Error saving settings: {e}")
 
+    def open_search(self):
+        """Show the history search window, or raise it if it is already open"""
+        if self.search_window and self.search_window.winfo_exists():
+            self.search_window.lift()
+            return
+        if not self.chat.history:
+            self.add_system_message("Chat history is turned off")
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Search Chat History")
+        window.geometry("600x450")
+        window.configure(bg='#18181b')
+        self.search_window = window
+
+        query_frame = tk.Frame(window, bg='#18181b')
+        query_frame.pack(fill=tk.X, padx=5, pady=5)
+        tk.Label(query_frame, text="Text:", bg='#18181b', fg='white', font=('Comic Sans MS', 9)).pack(side=tk.LEFT, padx=5)
+        text_var = tk.StringVar()
+        text_entry = tk.Entry(query_frame, textvariable=text_var, bg='#2d2d2d', fg='white',
+                              insertbackground='white', font=('Comic Sans MS', 9))
+        text_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        tk.Label(query_frame, text="User:", bg='#18181b', fg='white', font=('Comic Sans MS', 9)).pack(side=tk.LEFT, padx=5)
+        user_var = tk.StringVar()
+        tk.Entry(query_frame, textvariable=user_var, width=15, bg='#2d2d2d', fg='white',
+                 insertbackground='white', font=('Comic Sans MS', 9)).pack(side=tk.LEFT, padx=5)
+
+        filter_frame = tk.Frame(window, bg='#18181b')
+        filter_frame.pack(fill=tk.X, padx=5)
+        platform_var = tk.StringVar(value=HISTORY_PLATFORMS[0][0])
+        range_var = tk.StringVar(value=HISTORY_RANGES[0][0])
+        for var, choices in ((platform_var, HISTORY_PLATFORMS), (range_var, HISTORY_RANGES)):
+            menu = tk.OptionMenu(filter_frame, var, *(label for label, _ in choices))
+            menu.configure(bg='#2d2d2d', fg='white', highlightthickness=0, font=('Comic Sans MS', 9))
+            menu.pack(side=tk.LEFT, padx=5)
+        status_var = tk.StringVar()
+        tk.Label(filter_frame, textvariable=status_var, bg='#18181b', fg='#888888',
+                 font=('Comic Sans MS', 9)).pack(side=tk.RIGHT, padx=5)
+
+        results = scrolledtext.ScrolledText(window, wrap=tk.WORD, bg='#18181b', fg='white',
+                                            font=('Comic Sans MS', 10), state=tk.DISABLED)
+        results.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        results.tag_configure("timestamp", foreground="#888888")
+        results.tag_configure("channel", foreground="#6b6b75")
+        results.tag_configure("twitch_username", foreground="#9147ff")
+        results.tag_configure("youtube_username", foreground="#ff0000")
+
+        def on_search(event=None):
+            platform = dict(HISTORY_PLATFORMS)[platform_var.get()]
+            max_age = dict(HISTORY_RANGES)[range_var.get()]
+            since = time.time() - max_age if max_age else None
+            status_var.set("Searching...")
+            self.search_history(text_var.get(), user_var.get().strip().lstrip('@') or None, platform, since,
+                                results, status_var)
+
+        tk.Button(filter_frame, text="Search", bg='#9147ff', fg='white',
+                  command=on_search, font=('Comic Sans MS', 9)).pack(side=tk.LEFT, padx=5)
+        window.bind('<Return>', on_search)
+        text_entry.focus_set()
+
+    def search_history(self, text, username, platform, since, results, status_var):
+        """Run a history query off the Tk thread and show it unless a newer search has started"""
+        self.search_generation += 1
+        generation = self.search_generation
+        history = self.chat.history
+
+        def run():
+            started = time.perf_counter()
+            try:
+                rows = history.search(text, username, platform, since)
+                error = None
+            except Exception as e:
+                rows, error = [], e
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.root.after(0, self.show_search_results, generation, rows, error, elapsed_ms, results, status_var)
+
+        self.search_executor.submit(run)
+
+    def show_search_results(self, generation, rows, error, elapsed_ms, results, status_var):
+        if generation != self.search_generation or not results.winfo_exists():
+            return
+        if error:
+            status_var.set(f"Search failed: {error}")
+            return
+        status_var.set(f"{len(rows)} results in {elapsed_ms:.0f} ms")
+        results.config(state=tk.NORMAL)
+        results.delete('1.0', tk.END)
+        # Oldest first, like the chat itself
+        for timestamp, platform, channel, username, message in reversed(rows):
+            results.insert(tk.END, f"[{datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}] ", "timestamp")
+            if channel:
+                results.insert(tk.END, f"#{channel} ", "channel")
+            results.insert(tk.END, f"{username}: ", f"{platform}_username")
+            results.insert(tk.END, f"{message}\n")
+        results.config(state=tk.DISABLED)
+        results.see(tk.END)
+
+    def settings_file_mtime(self):
+        try:
+            return os.path.getmtime(SETTINGS_FILE)
+        except OSError:
+            return None
+
+    def check_settings_file(self):
+        """Reload the filter rules when the settings file is edited while the window is open"""
+        try:
+            mtime = self.settings_file_mtime()
+            if mtime != self.settings_mtime:
+                self.settings_mtime = mtime
+                self.reload_rules()
+        finally:
+            self.root.after(SETTINGS_POLL_MS, self.check_settings_file)
+
+    def reload_rules(self):
+        try:
+            settings = read_settings()
+        except Exception as e:
+            self.add_system_message(f"Error reloading rules: {e}")
+            return
+        errors = self.chat.set_rules(settings.get('rules', []))
+        self.add_system_message(f"Loaded {len(self.chat.rules)} filter rules")
+        self.report_rule_errors(errors)
+
+    def report_rule_errors(self, errors):
+        for error in errors:
+            self.add_system_message(f"Skipped filter {error}")
+
     def prompt_twitch_token(self):
         token_dialog = tk.Toplevel(self.root)
         token_dialog.title("Twitch OAuth Token")
@@ -751,7 +1464,7 @@ class MultiPlatformChat:
         help_link = tk.Label(help_frame, text="Open Token Generator", fg='#9147ff',
                            cursor="hand2", bg='#18181b', font=('Comic Sans MS', 9))
         help_link.pack(side=tk.LEFT)
-        help_link.bind("<Button-1>", lambda e: webbrowser.open(TOKEN_HELP_URL))
+        help_link.bind("<Button-1>", lambda e: open_token_help())
 
         token_entry = tk.Entry(token_dialog, width=40, bg='#2d2d2d', fg='white',
                              insertbackground='white', font=('Comic Sans MS', 10))
@@ -765,7 +1478,7 @@ class MultiPlatformChat:
             if token:
                 if not token.startswith('oauth:'):
                     token = 'oauth:' + token
-                self.twitch_token = token
+                self.chat.twitch_token = token
                 self.save_settings()
                 token_dialog.destroy()
                 return True
@@ -782,7 +1495,7 @@ class MultiPlatformChat:
         token_dialog.geometry(f"+{x}+{y}")
 
         self.root.wait_window(token_dialog)
-        return self.twitch_token is not None
+        return self.chat.twitch_token is not None
 
     def prompt_youtube_api_key(self):
         dialog = tk.Toplevel(self.root)
@@ -835,10 +1548,18 @@ class MultiPlatformChat:
 
     def update_status(self):
         status = []
-        if self.connected_services['twitch']:
-            status.append(f"Twitch: #{self.twitch_channel}")
-        if self.connected_services['youtube']:
-            status.append(f"YouTube: {self.youtube_video_id}")
+        if self.chat.connected_services['twitch']:
+            status.append(f"Twitch: {', '.join('#' + name for name in self.chat.twitch_channels)}")
+        if self.chat.connected_services['youtube']:
+            status.append(f"YouTube: {self.chat.youtube_video_id}")
+        if self.chat.connected_services['replay']:
+            status.append("Replaying")
+        if self.render_queue_depth:
+            status.append(f"Queued: {self.render_queue_depth}")
+        if self.shed_total:
+            status.append(f"Skipped: {self.shed_total}")
+        if self.chat.youtube_resolver.quota_used:
+            status.append(f"Quota: {self.chat.youtube_resolver.quota_used}")
 
         if not status:
             self.status_var.set("Disconnected from both services")
@@ -847,10 +1568,14 @@ class MultiPlatformChat:
 
     def on_closing(self):
         self.save_settings()
-        if self.connected_services['twitch']:
+        if self.chat.connected_services['twitch']:
             self.disconnect_twitch()
-        if self.connected_services['youtube']:
+        if self.chat.connected_services['youtube']:
             self.disconnect_youtube()
+        self.image_executor.shutdown(wait=False, cancel_futures=True)
+        self.search_executor.shutdown(wait=False, cancel_futures=True)
+        self.image_cache.save_index()
+        self.chat.close()
         self.root.destroy()
 
     def run(self):
@@ -858,17 +1583,20 @@ class MultiPlatformChat:
         self.root.mainloop()
 
 if __name__ == "__main__":
-    try:
-        import pytchat
-        import requests
-        from PIL import Image, ImageTk
-    except ImportError:
+    import argparse
+    import importlib.util
+
+    parser = argparse.ArgumentParser(description="Twitch and YouTube chat in one window")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="report import and startup timings once the window is up")
+    args = parser.parse_args()
+
+    # Look the packages up without importing them, so the check does not undo the lazy imports
+    missing = [package for package, module in (('pytchat', 'pytchat'), ('requests', 'requests'), ('pillow', 'PIL'))
+               if importlib.util.find_spec(module) is None]
+    if missing and not getattr(sys, 'frozen', False):
         import subprocess
-        import sys
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "pytchat", "requests", "pillow"])
-        import pytchat
-        import requests
-        from PIL import Image, ImageTk
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *missing])
 
-    app = MultiPlatformChat()
+    app = MultiPlatformChat(profile_startup=args.profile_startup or os.getenv('CHAT_PROFILE_STARTUP') == '1')
     app.run()
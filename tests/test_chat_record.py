@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import ChatEngine, mentions_donation, parse_twitch_line
+
+
+def privmsg(message, emotes=''):
+    return (f"@badges=;color=;display-name=viewer;emotes={emotes};room-id=12345 "
+            f":viewer!viewer@viewer.tmi.twitch.tv PRIVMSG #channel :{message}")
+
+
+class TwitchRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.chat = ChatEngine()
+
+    def tearDown(self):
+        self.chat.close()
+
+    def test_emotes_are_laid_out_into_segments(self):
+        record = self.chat.twitch_record(parse_twitch_line(privmsg("hi Kappa there", "25:3-7")))
+
+        self.assertEqual(record.emotes, (("hi ", None), ("Kappa", "25"), (" there", None)))
+        self.assertNotIn('badges', record.as_dict())
+
+    def test_plain_messages_have_no_segments(self):
+        record = self.chat.twitch_record(parse_twitch_line(privmsg("hello there")))
+
+        self.assertIsNone(record.emotes)
+
+
+class MentionsDonationTest(unittest.TestCase):
+    def test_keywords_match_anywhere_ignoring_case(self):
+        for message in ("just DONATED 5", "thanks for the donation", "Cheered 100"):
+            self.assertTrue(mentions_donation(message), message)
+        for message in ("please donate", "cheer up", "hello"):
+            self.assertFalse(mentions_donation(message), message)
+
+
+if __name__ == "__main__":
+    unittest.main()
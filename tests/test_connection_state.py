@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import RECONNECT_STABLE_TIME, ConnectionState
+
+
+class ConnectionStateTest(unittest.TestCase):
+    def test_backoff_keeps_growing_while_connections_drop_at_once(self):
+        state = ConnectionState(base_delay=1.0, max_delay=60.0)
+        delays = []
+        for _ in range(5):
+            state.connected()
+            state.disconnected()
+            delays.append(state.next_delay())
+
+        self.assertGreaterEqual(delays[-1], 8.0)
+
+    def test_backoff_resets_after_a_stable_connection(self):
+        state = ConnectionState(base_delay=1.0, max_delay=60.0)
+        for _ in range(5):
+            state.next_delay()
+        state.connected()
+        state.connected_at = time.monotonic() - RECONNECT_STABLE_TIME
+        state.disconnected()
+
+        self.assertLessEqual(state.next_delay(), 1.0)
+
+    def test_backoff_resets_after_a_connection_that_carried_chat(self):
+        state = ConnectionState(base_delay=1.0, max_delay=60.0)
+        for _ in range(5):
+            state.next_delay()
+        state.connected()
+        state.messages += 1
+        state.disconnected()
+
+        self.assertLessEqual(state.next_delay(), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
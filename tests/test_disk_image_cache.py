@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import DiskImageCache
+
+
+class DiskImageCacheTest(unittest.TestCase):
+    def test_files_missing_from_the_index_are_removed_on_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, "images")
+            cache = DiskImageCache(directory, http=None)
+            cache.write("emote/saved", b"saved")
+            cache.save_index()
+            # Written after the last index save, as if the app then crashed
+            cache.write("emote/lost", b"lost")
+
+            reloaded = DiskImageCache(directory, http=None)
+
+            self.assertEqual(list(reloaded.index), ["emote/saved"])
+            self.assertEqual(reloaded.total_bytes, len(b"saved"))
+            self.assertEqual(sorted(name for name in os.listdir(directory) if name.endswith('.png')),
+                             [reloaded.index["emote/saved"]["file"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
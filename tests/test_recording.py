@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import ChatRecorder, read_recording
+
+
+class ReadRecordingTest(unittest.TestCase):
+    def test_a_recording_still_being_written_reads_up_to_the_last_flush(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "chat.log.gz")
+            recorder = ChatRecorder(path, flush_interval=0)
+            try:
+                recorder.record('twitch', 'first', 1.0)
+                recorder.record('twitch', 'second', 2.0)
+
+                self.assertEqual(list(read_recording(path)),
+                                 [(1.0, 'twitch', 'first'), (2.0, 'twitch', 'second')])
+            finally:
+                recorder.close()
+
+    def test_a_closed_recording_reads_every_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "chat.log.gz")
+            recorder = ChatRecorder(path)
+            recorder.record('twitch', 'first', 1.0)
+            recorder.close()
+
+            self.assertEqual(list(read_recording(path)), [(1.0, 'twitch', 'first')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import ChatRecord, RuleSet
+
+
+class RuleColorTest(unittest.TestCase):
+    def test_colors_the_frontend_cannot_display_are_skipped(self):
+        config = [{"action": "color", "color": "notacolor", "keywords": ["hype"]},
+                  {"action": "color", "color": "red", "keywords": ["gg"]}]
+        rules = RuleSet(config, color_check=lambda color: color == "red")
+
+        self.assertEqual(len(rules), 1)
+        self.assertEqual(rules.errors, ["rule 1: unknown color 'notacolor'"])
+
+    def test_without_a_color_check_only_the_format_is_validated(self):
+        config = [{"action": "color", "color": "notacolor", "keywords": ["hype"]},
+                  {"action": "color", "color": "#12", "keywords": ["gg"]}]
+        rules = RuleSet(config)
+
+        self.assertEqual(len(rules), 1)
+        self.assertEqual(rules.errors, ["rule 2: invalid color '#12'"])
+
+
+class RuleConditionTest(unittest.TestCase):
+    def test_conditions_given_as_a_bare_string_are_skipped(self):
+        config = [{"action": "hide", "keywords": "spam"},
+                  {"action": "hide", "users": "bob"},
+                  {"action": "hide", "platforms": "twitch"},
+                  {"action": "hide", "keywords": ["spam"], "users": ["bob"], "platforms": ["twitch"]}]
+        rules = RuleSet(config)
+
+        self.assertEqual(len(rules), 1)
+        self.assertEqual(rules.errors, ["rule 1: keywords must be a list of strings",
+                                        "rule 2: users must be a list of strings",
+                                        "rule 3: platforms must be a list of strings"])
+
+
+class RuleHideTest(unittest.TestCase):
+    def test_hidden_records_are_marked_not_dropped(self):
+        rules = RuleSet([{"action": "hide", "keywords": ["spam"]}])
+        spam = ChatRecord('chat', '00:00:00', 'twitch', 'user', 'buy spam now')
+        hello = ChatRecord('chat', '00:00:00', 'twitch', 'user', 'hello')
+
+        self.assertFalse(rules.apply(spam))
+        self.assertTrue(rules.apply(hello))
+        self.assertTrue(spam.hidden)
+        self.assertFalse(hello.hidden)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import unittest
+from collections import deque
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import ChatRecord, Metrics
+from main import MultiPlatformChat
+
+
+def stale_queue(records, age=10.0):
+    queued_at = time.monotonic() - age
+    for record in records:
+        record.queued_at = queued_at
+    return deque(records)
+
+
+def fake_window(queue):
+    """Just the state shed_load reads, so it can run without a Tk root"""
+    return SimpleNamespace(render_queue=queue, max_messages_per_frame=150, shed_max_latency_ms=2000,
+                           render_rate=100.0, shed_total=0, chat=SimpleNamespace(metrics=Metrics()))
+
+
+def chat_record(message, **fields):
+    return ChatRecord('chat', '00:00:00', 'twitch', 'user', message, **fields)
+
+
+class ShedLoadTest(unittest.TestCase):
+    def test_only_unsheddable_lines_are_left_alone(self):
+        records = [chat_record(f"hype {i}", is_highlight=True) for i in range(200)]
+        records += [chat_record(f"cheer {i}", bits=100, is_donation=True) for i in range(200)]
+        window = fake_window(stale_queue(records))
+
+        MultiPlatformChat.shed_load(window, time.monotonic())
+
+        self.assertEqual(list(window.render_queue), records)
+        self.assertEqual(window.shed_total, 0)
+
+    def test_mixed_priorities_drop_viewers_and_keep_highlights(self):
+        highlights = [chat_record(f"hype {i}", is_highlight=True) for i in range(100)]
+        viewers = [chat_record(f"hello {i}") for i in range(300)]
+        window = fake_window(stale_queue(highlights + viewers))
+
+        MultiPlatformChat.shed_load(window, time.monotonic())
+
+        kept = [record for record in window.render_queue if record.kind == 'chat']
+        markers = [record for record in window.render_queue if record.kind == 'system']
+        self.assertEqual(kept[:100], highlights)
+        self.assertEqual(len(kept), 200)
+        self.assertEqual(window.shed_total, 200)
+        self.assertEqual(len(markers), 1)
+        self.assertEqual(markers[0].message, "200 messages skipped to keep up with chat")
+
+
+if __name__ == "__main__":
+    unittest.main()